@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+'''
+Fixed benchmark set of the OCCI tent parser, client and suite runner.
+
+Results are saved as JSON and compared with a baseline of an earlier run;
+benchmarks slower than the baseline by more than the threshold are flagged
+and make the run exit with status 1.
+
+Run from the repository root: python3 -m benchmarks [--output FILE] [--baseline FILE]
+'''
+
+from datetime import datetime
+import argparse, http.client, io, json, os, platform, sys
+
+from inc.client import OCCIClient, OCCIResponse
+from inc.mock import MockOCCIServer
+from inc.occi import CategoryStructure, LinkStructure
+from benchmarks.parser import bestOf, syntheticBody, syntheticLinks
+
+class CannedResponse:
+	'''Finished HTTP response with a fixed body, as passed to `OCCIResponse` by the transport.'''
+
+	def __init__ ( self, body, contentType = 'text/plain' ):
+		self.code = self.status = 200
+		self._info = http.client.HTTPMessage()
+		self._info['Content-Type'] = contentType
+		self._body = io.BytesIO( body )
+
+	def info ( self ):
+		return self._info
+
+	def getheader ( self, name, default = None ):
+		return self._info.get( name, default )
+
+	def read ( self ):
+		return self._body.read()
+
+	def readline ( self ):
+		return self._body.readline()
+
+	def close ( self ):
+		pass
+
+
+def parseBenchmarks ( sizes, repeat, minTime = 0.0 ):
+	'''Yield `( name, seconds, items, unit )` of structure and response parsing, uncached.'''
+	cache, OCCIResponse.parseCache = OCCIResponse.parseCache, None
+	try:
+		for lines in sizes:
+			categories = syntheticBody( lines ).split( '\n' )
+			yield 'parse.category.{0}'.format( lines ), bestOf( lambda: [ CategoryStructure.parse( line ) for line in categories ], repeat, minTime ), lines, 'lines'
+
+			links = syntheticLinks( lines ).split( '\n' )
+			yield 'parse.link.{0}'.format( lines ), bestOf( lambda: [ LinkStructure.parse( line ) for line in links ], repeat, minTime ), lines, 'lines'
+
+			body = '\n'.join( categories ).encode()
+			yield 'parse.response.{0}'.format( lines ), bestOf( lambda: OCCIResponse( CannedResponse( body ) ), repeat, minTime ), lines, 'lines'
+	finally:
+		OCCIResponse.parseCache = cache
+
+def renderBenchmarks ( lines, repeat, minTime = 0.0 ):
+	'''Yield `( name, seconds, items, unit )` of rendering parsed structures for header fields.'''
+	categories = [ CategoryStructure.parse( line ) for line in syntheticBody( lines ).split( '\n' ) ]
+	yield 'render.category', bestOf( lambda: [ repr( structure ) for structure in categories ], repeat, minTime ), lines, 'structures'
+
+	links = [ LinkStructure.parse( line ) for line in syntheticLinks( lines ).split( '\n' ) ]
+	yield 'render.link', bestOf( lambda: [ repr( structure ) for structure in links ], repeat, minTime ), lines, 'structures'
+
+def clientBenchmarks ( requests, repeat, minTime = 0.0 ):
+	'''Yield `( name, seconds, items, unit )` of requests through `OCCIClient.request` against the mock server.'''
+	server = MockOCCIServer.fromConfig( { 'collectionSize' : 10 } ).start()
+	client = OCCIClient( *server.address )
+	try:
+		client.request( 'GET', '/-/' )
+		yield 'client.query', bestOf( lambda: [ client.request( 'GET', '/-/' ) for i in range( requests ) ], repeat, minTime ), requests, 'requests'
+		yield 'client.collection', bestOf( lambda: [ client.request( 'GET', '/compute/' ) for i in range( requests ) ], repeat, minTime ), requests, 'requests'
+		yield 'client.batch', bestOf( lambda: client.batch( [ ( 'GET', '/compute/' ) ] * requests ), repeat, minTime ), requests, 'requests'
+	finally:
+		client.close()
+		server.stop()
+
+def suiteBenchmarks ( suite, repeat, minTime = 0.0, jobs = 1 ):
+	'''Yield `( name, seconds, items, unit )` of running a suite end-to-end with `Tent.runSuite` against the mock server.'''
+	from inc.tent import Tent
+	tent = Tent( io.StringIO( 'host: 127.0.0.1\nport: 0\nmock: true\n' ) )
+	output = open( os.devnull, 'w' )
+	try:
+		cases = len( list( tent.loadTestCases( suite ) ) )
+		yield 'suite', bestOf( lambda: tent.runSuite( suite, output, suppressPrint=True, jobs=jobs ), repeat, minTime ), cases, 'cases'
+	finally:
+		output.close()
+		tent.client.close()
+		tent.mockServer.stop()
+
+def run ( sizes = ( 100, 10000, 100000 ), requests = 1000, suite = 'suites/core_example.yaml', repeat = 5, only = None, minTime = 0.2 ):
+	'''
+	Run the benchmark set, or the benchmarks whose names start with one of
+	`only`; every sample lasts at least `minTime` seconds. Return the results
+	by name and the errors of failed groups.
+	'''
+	groups = [
+		( 'parse.', lambda: parseBenchmarks( sizes, repeat, minTime ) ),
+		( 'render.', lambda: renderBenchmarks( 10000, repeat, minTime ) ),
+		( 'client.', lambda: clientBenchmarks( requests, repeat, minTime ) ),
+		( 'suite', lambda: suiteBenchmarks( suite, repeat, minTime ) ) ]
+
+	results, errors = {}, {}
+	for prefix, group in groups:
+		if only and not any( prefix.startswith( name ) or name.startswith( prefix ) for name in only ):
+			continue
+		try:
+			for name, seconds, items, unit in group():
+				if only and not any( name.startswith( o ) for o in only ):
+					continue
+				results[name] = { 'seconds' : seconds, 'items' : items, 'unit' : unit, 'rate' : items / seconds }
+				print( '{0:<24} {1:9.4f} s  {2:12.0f} {3}/s'.format( name, seconds, items / seconds, unit ), file=sys.stderr )
+		except Exception as e:
+			# keep the results of the other groups
+			errors[prefix] = '{0}: {1}'.format( type( e ).__name__, e )
+			print( '{0:<24} failed: {1}'.format( prefix, errors[prefix] ), file=sys.stderr )
+	return results, errors
+
+def compare ( results, baseline, threshold = 0.1 ):
+	'''Return `( name, ratio )` pairs of benchmarks slower than the baseline by more than the threshold.'''
+	regressions = []
+	for name, result in sorted( results.items() ):
+		previous = baseline.get( name )
+		if previous is None or previous['items'] != result['items']:
+			continue
+		ratio = result['seconds'] / previous['seconds']
+		if ratio > 1 + threshold:
+			regressions.append( ( name, ratio ) )
+	return regressions
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser( prog='python3 -m benchmarks', description='OCCI tent benchmark set' )
+	parser.add_argument( '--output', '-o', metavar='FILE', help='save the results as JSON' )
+	parser.add_argument( '--baseline', '-b', metavar='FILE', help='compare with the results of an earlier run' )
+	parser.add_argument( '--threshold', default=0.1, type=float, help='slowdown flagged as regression, as fraction (default: %(default)s)' )
+	parser.add_argument( '--only', action='append', metavar='PREFIX', help='run only benchmarks with this name prefix; may be repeated' )
+	parser.add_argument( '--sizes', default='100,10000,100000', help='comma-separated parse body sizes in lines (default: %(default)s)' )
+	parser.add_argument( '--requests', default=1000, type=int, help='requests per client benchmark (default: %(default)s)' )
+	parser.add_argument( '--suite', default='suites/core_example.yaml', help='suite run end-to-end (default: %(default)s)' )
+	parser.add_argument( '--repeat', default=5, type=int, help='repetitions, the best is reported (default: %(default)s)' )
+	parser.add_argument( '--min-time', default=0.2, type=float, help='minimum seconds per repetition, short benchmarks are looped (default: %(default)s)', metavar='T' )
+	args = parser.parse_args()
+
+	results, errors = run( tuple( int( size ) for size in args.sizes.split( ',' ) ), args.requests, args.suite, args.repeat, args.only, args.min_time )
+
+	if args.output:
+		with open( args.output, 'w' ) as f:
+			json.dump( { 'created' : datetime.utcnow().isoformat( ' ' ), 'python' : platform.python_version(),
+				'platform' : platform.platform(), 'results' : results, 'errors' : errors }, f, indent='\t', sort_keys=True )
+
+	if args.baseline:
+		with open( args.baseline ) as f:
+			regressions = compare( results, json.load( f )['results'], args.threshold )
+		for name, ratio in regressions:
+			print( 'Regression: {0} is {1:.0%} slower than the baseline.'.format( name, ratio - 1 ) )
+		if not regressions:
+			print( 'No regressions above {0:.0%}.'.format( args.threshold ) )
+	else:
+		regressions = []
+
+	if regressions or errors:
+		sys.exit( 1 )
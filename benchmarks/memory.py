@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+'''
+Memory benchmark: parsed query interfaces of several providers held at once.
+
+Run from the repository root: python3 -m benchmarks.memory [PROVIDERS] [LINES]
+'''
+
+import argparse, gc, tracemalloc
+
+from inc.client import OCCIResponse
+from benchmarks.parser import syntheticBody
+
+def run ( providers = 5, lines = 10000 ):
+	'''Parse one synthetic query interface per provider and measure the retained memory.'''
+	bodies = [ syntheticBody( lines ) for i in range( providers ) ]
+	cache, OCCIResponse.parseCache = OCCIResponse.parseCache, None
+	gc.collect()
+	tracemalloc.start()
+	before = tracemalloc.take_snapshot()
+	
+	parsed = [ [ OCCIResponse.parseStructure( line ) for line in body.split( '\n' ) ] for body in bodies ]
+	gc.collect()
+	after = tracemalloc.take_snapshot()
+	tracemalloc.stop()
+	OCCIResponse.parseCache = cache
+	
+	retained = sum( stat.size_diff for stat in after.compare_to( before, 'filename' ) )
+	structures = sum( map( len, parsed ) )
+	return { 'bytes' : retained, 'structures' : structures, 'bytesPerStructure' : retained / structures }
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser( description='OCCI tent structure memory benchmark' )
+	parser.add_argument( 'providers', nargs='?', default=5, type=int, help='number of query interfaces held (default: %(default)s)' )
+	parser.add_argument( 'lines', nargs='?', default=10000, type=int, help='category lines per query interface (default: %(default)s)' )
+	args = parser.parse_args()
+	
+	result = run( args.providers, args.lines )
+	print( '{0[structures]} structures retain {1:.1f} MB, {0[bytesPerStructure]:.0f} bytes per structure'.format( result, result['bytes'] / 1e6 ) )
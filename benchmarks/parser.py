@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+'''
+Parser throughput benchmark on synthetic `text/plain` query interface bodies.
+
+Run from the repository root: python3 -m benchmarks.parser [LINES]
+'''
+
+import argparse, time
+
+from inc.client import OCCIResponse
+from inc.occi import parseText
+from inc.util import LRUCache
+
+def syntheticBody ( lines = 10000, distinctAttributes = 100 ):
+	'''Generate a query interface rendering with the given number of category lines.'''
+	classes = ( 'kind', 'mixin', 'action' )
+	return '\n'.join(
+		'Category: term{0}; scheme="http://schemas.ogf.org/occi/infrastructure/x{1}#"; class="{2}"; title="Title {0}"; '
+		'rel="http://schemas.ogf.org/occi/core#resource"; location="/t{0}/"; '
+		'attributes="occi.compute.cores{{required}} occi.compute.hostname{{immutable}} occi.compute.speed x.attr{3}"; '
+		'actions="http://schemas.ogf.org/occi/infrastructure/compute/action#start http://schemas.ogf.org/occi/infrastructure/compute/action#stop"'
+		.format( i, i % 10, classes[i % 3], i % distinctAttributes ) for i in range( lines ) )
+
+def syntheticLinks ( lines = 10000 ):
+	'''Generate a rendering with the given number of link lines.'''
+	return '\n'.join(
+		'Link: </network/n{0}>; rel="http://schemas.ogf.org/occi/infrastructure#network"; self="/link/networkinterface/l{0}"; '
+		'category="http://schemas.ogf.org/occi/infrastructure#networkinterface"; '
+		'occi.networkinterface.interface="eth{1}"; occi.networkinterface.mac="00:11:22:33:44:{2:02x}"'
+		.format( i, i % 4, i % 256 ) for i in range( lines ) )
+
+def bestOf ( func, repeat = 5, minTime = 0.0 ):
+	'''
+	Return the best wall time of a call to func over `repeat` samples. Each
+	sample calls func as often as needed to last at least `minTime` seconds,
+	so short calls are not dominated by timer and scheduling noise.
+	'''
+	start = time.perf_counter()
+	func()
+	elapsed = time.perf_counter() - start
+	calls = max( 1, int( minTime / elapsed ) + 1 ) if elapsed < minTime else 1
+
+	best = float( 'inf' )
+	for i in range( repeat ):
+		start = time.perf_counter()
+		for j in range( calls ):
+			func()
+		best = min( best, ( time.perf_counter() - start ) / calls )
+	return best
+
+def run ( lines = 10000, repeat = 5 ):
+	body = syntheticBody( lines )
+	parseLines = lambda: [ OCCIResponse.parseStructure( line ) for line in body.split( '\n' ) ]
+	cache = OCCIResponse.parseCache
+	try:
+		OCCIResponse.parseCache = None
+		results = {
+			'parseText' : bestOf( lambda: parseText( body ), repeat ),
+			'parseStructure' : bestOf( parseLines, repeat ) }
+		
+		# warm cache, every line is a hit
+		OCCIResponse.parseCache = LRUCache( lines )
+		parseLines()
+		results['parseStructureCached'] = bestOf( parseLines, repeat )
+	finally:
+		OCCIResponse.parseCache = cache
+	return { name : { 'seconds' : seconds, 'linesPerSecond' : lines / seconds, 'megabytesPerSecond' : len( body ) / seconds / 1e6 } for name, seconds in results.items() }
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser( description='OCCI tent parser benchmark' )
+	parser.add_argument( 'lines', nargs='?', default=10000, type=int, help='number of category lines (default: %(default)s)' )
+	parser.add_argument( '--repeat', default=5, type=int, help='repetitions, the best is reported (default: %(default)s)' )
+	args = parser.parse_args()
+	
+	for name, result in sorted( run( args.lines, args.repeat ).items() ):
+		print( '{0:<22} {1[seconds]:8.4f} s  {1[linesPerSecond]:10.0f} lines/s  {1[megabytesPerSecond]:6.1f} MB/s'.format( name, result ) )
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+'''
+OCCI tent HTTP response cache.
+'''
+
+import threading
+
+from .transport import BufferedResponse
+from .util import LRUCache
+
+__all__ = [ 'HTTPCache' ]
+
+class CacheEntry:
+	'''Cached response body with its validators.'''
+	__slots__ = ( 'path', 'status', 'reason', 'headers', 'body', 'etag', 'lastModified' )
+
+	def __init__ ( self, path, status, reason, headers, body ):
+		self.path = path
+		self.status = status
+		self.reason = reason
+		self.headers = headers
+		self.body = body
+		self.etag = headers.get( 'ETag' )
+		self.lastModified = headers.get( 'Last-Modified' )
+
+	def conditionalHeaders ( self ):
+		'''Return the request headers validating this entry.'''
+		headers = {}
+		if self.etag:
+			headers['If-None-Match'] = self.etag
+		if self.lastModified:
+			headers['If-Modified-Since'] = self.lastModified
+		return headers
+
+	def response ( self ):
+		'''Return a fresh response object serving the cached body.'''
+		return BufferedResponse( self.status, self.reason, self.headers, self.body )
+
+
+class HTTPCache:
+	'''
+	Validator-based cache for GET responses. Responses carrying an `ETag` or
+	`Last-Modified` header are stored and revalidated with conditional
+	requests; a `304 Not Modified` answer is served from the cache. Any other
+	request method invalidates all entries whose path overlaps the request
+	path. At most `maxEntries` responses are kept, evicting the least recently
+	used ones; bodies larger than `maxBodySize` bytes are not cached.
+	'''
+	ignoredHeaders = frozenset( ( 'user-agent', 'if-none-match', 'if-modified-since' ) )
+
+	def __init__ ( self, maxEntries = 256, maxBodySize = 4 * 1024 * 1024 ):
+		self.maxBodySize = maxBodySize
+		self._entries = LRUCache( maxEntries )
+		self._lock = threading.Lock()
+		self.resetStats()
+
+	def resetStats ( self ):
+		with self._lock:
+			self.hits = 0
+			self.misses = 0
+			self.invalidations = 0
+			self._evictions = self._entries.evictions
+
+	@staticmethod
+	def pathOf ( selector ):
+		return selector.split( '?', 1 )[0]
+
+	def key ( self, selector, headers ):
+		'''Cache key; requests with different filter or accept headers are cached separately.'''
+		return selector, tuple( sorted( ( name.lower(), value ) for name, value in headers.items() if name.lower() not in self.ignoredHeaders ) )
+
+	def lookup ( self, selector, headers ):
+		'''Return the entry for the request, if any.'''
+		return self._entries.get( self.key( selector, headers ) )
+
+	def store ( self, selector, headers, response ):
+		'''
+		Read the response and cache it if it has validators. Return a response
+		object to be used in place of the consumed one.
+		'''
+		if response.getheader( 'ETag' ) is None and response.getheader( 'Last-Modified' ) is None:
+			return response
+
+		body = response.read()
+		response.close()
+		entry = CacheEntry( self.pathOf( selector ), response.status, response.reason, response.info(), body )
+		if len( body ) <= self.maxBodySize:
+			self._entries.put( self.key( selector, headers ), entry )
+		return entry.response()
+
+	def countHit ( self ):
+		with self._lock:
+			self.hits += 1
+
+	def countMiss ( self ):
+		with self._lock:
+			self.misses += 1
+
+	def invalidate ( self, selector ):
+		'''Drop all entries for paths above or below the given path.'''
+		path = self.pathOf( selector )
+		stale = [ key for key, entry in self._entries.items() if entry.path.startswith( path ) or path.startswith( entry.path ) ]
+		for key in stale:
+			self._entries.pop( key )
+		with self._lock:
+			self.invalidations += len( stale )
+
+	def clear ( self ):
+		self._entries.clear()
+
+	def stats ( self ):
+		'''Return hit, miss, invalidation and eviction counts since the last reset.'''
+		with self._lock:
+			return { 'hits' : self.hits, 'misses' : self.misses, 'invalidations' : self.invalidations,
+				'evictions' : self._entries.evictions - self._evictions, 'size' : len( self._entries ) }
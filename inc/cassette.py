@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+'''
+OCCI tent request recording and replay.
+'''
+
+from collections import deque
+import http.client, json, random, threading, time
+
+from .occi import parseHeaders
+from .transport import BufferedResponse
+
+__all__ = [ 'CassetteMiss', 'CassettePlayer', 'CassetteRecorder', 'Exchange', 'RecordingTransport', 'ReplayTransport', 'openCassette' ]
+
+def _text ( data ):
+	'''Return bytes as text that survives JSON serialization and `_bytes` unchanged.'''
+	if data is None or isinstance( data, str ):
+		return data
+	return data.decode( 'utf-8', 'surrogateescape' )
+
+def _bytes ( text ):
+	return text.encode( 'utf-8', 'surrogateescape' ) if isinstance( text, str ) else text
+
+
+class CassetteMiss ( LookupError ):
+	'''Request without a matching recorded exchange.'''
+
+
+class Exchange:
+	'''Recorded request and decoded response with the time it took.'''
+	__slots__ = ( 'method', 'path', 'headers', 'body', 'status', 'reason', 'responseHeaders', 'response', 'time' )
+	ignoredHeaders = frozenset( ( 'user-agent', 'accept-encoding', 'content-length' ) )
+	droppedHeaders = frozenset( ( 'content-encoding', 'content-length', 'transfer-encoding' ) )
+
+	def __init__ ( self, method, path, headers, body, status, reason, responseHeaders, response, time ):
+		self.method = method
+		self.path = path
+		self.headers = headers
+		self.body = body
+		self.status = status
+		self.reason = reason
+		self.responseHeaders = responseHeaders
+		self.response = response
+		self.time = time
+
+	@classmethod
+	def key ( cls, method, path, headers, body ):
+		'''
+		Request identity for matching. Headers that do not change the response
+		are ignored, and OCCI header structures compare independent of order.
+		'''
+		fields = []
+		for name, value in headers.items():
+			if name.lower() not in cls.ignoredHeaders:
+				structures = parseHeaders( ( ( name, value ), ) )
+				fields.append( ( name.lower(), tuple( sorted( map( repr, structures ) ) ) if structures else value ) )
+		return method, path, tuple( sorted( fields ) ), _text( body )
+
+	@classmethod
+	def fromRecord ( cls, record ):
+		return cls( *( record[name] for name in cls.__slots__ ) )
+
+	def record ( self ):
+		return { name : getattr( self, name ) for name in self.__slots__ }
+
+	def buffered ( self ):
+		'''Return a fresh response object serving the recorded response.'''
+		headers = http.client.HTTPMessage()
+		for name, value in self.responseHeaders:
+			headers[name] = value
+		body = _bytes( self.response )
+		headers['Content-Length'] = str( len( body ) )
+		return BufferedResponse( self.status, self.reason, headers, body )
+
+
+class CassetteRecorder:
+	'''
+	Cassette file being recorded: one compact JSON object per exchange, in the
+	order the responses were completed. Exchanges are flushed as they are
+	written, so the cassette stays usable if the run is interrupted.
+
+	The first line holds the seed of the `random` module, which is seeded
+	with it here and again on playback, so test modules choosing randomly
+	make the same choices and thus the same requests when replayed.
+	'''
+
+	def __init__ ( self, fileName, seed = None ):
+		self.fileName = fileName
+		self.exchanges = 0
+		self.seed = random.randrange( 2 ** 32 ) if seed is None else seed
+		self._file = open( fileName, 'w' )
+		self._file.write( json.dumps( { 'seed' : self.seed } ) + '\n' )
+		self._lock = threading.Lock()
+		random.seed( self.seed )
+
+	def write ( self, exchange ):
+		line = json.dumps( exchange.record(), separators=( ',', ':' ) ) + '\n'
+		with self._lock:
+			self._file.write( line )
+			self._file.flush()
+			self.exchanges += 1
+
+	def transport ( self, transport ):
+		'''Wrap a client transport to record its exchanges on this cassette.'''
+		return RecordingTransport( transport, self )
+
+	def close ( self ):
+		with self._lock:
+			self._file.close()
+
+
+class CassettePlayer:
+	'''
+	Recorded exchanges served back in place of a server. In `order` mode
+	requests must arrive in the recorded order, and a request differing in
+	method or path from the next recorded one is a miss. In `match` mode a
+	request is answered by the next unused exchange with the same method,
+	path, relevant headers and body, independent of the order of requests;
+	this mode suits concurrent runs. Responses are delayed by `latency` times
+	the recorded time: 1 for the original latency, 0 for none. The `random`
+	module is seeded with the recorded seed, see `CassetteRecorder`.
+	'''
+
+	def __init__ ( self, fileName, mode = 'order', latency = 0.0 ):
+		if mode not in ( 'order', 'match' ):
+			raise ValueError( 'Unknown replay mode `{0}`'.format( mode ) )
+		self.fileName = fileName
+		self.mode = mode
+		self.latency = latency
+		self.served = 0
+		self._lock = threading.Lock()
+
+		with open( fileName ) as f:
+			records = [ json.loads( line ) for line in f if line.strip() ]
+		self.seed = records.pop( 0 )['seed'] if records and 'seed' in records[0] else None
+		if self.seed is not None:
+			random.seed( self.seed )
+		exchanges = [ Exchange.fromRecord( record ) for record in records ]
+		self._queue = deque( exchanges )
+		self._byRequest = {}
+		for exchange in exchanges:
+			self._byRequest.setdefault( Exchange.key( exchange.method, exchange.path, exchange.headers, exchange.body ), deque() ).append( exchange )
+
+	def __len__ ( self ):
+		return len( self._queue ) if self.mode == 'order' else sum( map( len, self._byRequest.values() ) )
+
+	def next ( self, method, path, headers, body ):
+		'''Return the recorded exchange answering the request, or raise `CassetteMiss`.'''
+		with self._lock:
+			if self.mode == 'order':
+				if not self._queue:
+					raise CassetteMiss( 'No recorded exchange left for {0} {1}'.format( method, path ) )
+				exchange = self._queue[0]
+				if exchange.method != method or exchange.path != path:
+					raise CassetteMiss( 'Expected {0} {1} but got {2} {3}'.format( exchange.method, exchange.path, method, path ) )
+				self._queue.popleft()
+			else:
+				exchanges = self._byRequest.get( Exchange.key( method, path, headers, body ) )
+				if not exchanges:
+					raise CassetteMiss( 'No recorded exchange matches {0} {1}'.format( method, path ) )
+				exchange = exchanges.popleft()
+			self.served += 1
+		return exchange
+
+	def transport ( self, transport ):
+		'''Return a transport replaying this cassette in place of a client transport.'''
+		transport.close()
+		return ReplayTransport( self, instrumentation=transport.instrumentation )
+
+	def close ( self ):
+		pass
+
+
+class RecordingTransport:
+	'''
+	Transport wrapper writing every exchange of the wrapped transport to a
+	`CassetteRecorder`. Response bodies are read completely and recorded
+	decoded; the client receives a buffered copy.
+	'''
+
+	def __init__ ( self, transport, recorder ):
+		self.transport = transport
+		self.recorder = recorder
+
+	@property
+	def instrumentation ( self ):
+		return self.transport.instrumentation
+
+	@instrumentation.setter
+	def instrumentation ( self, instrumentation ):
+		self.transport.instrumentation = instrumentation
+
+	@property
+	def pool ( self ):
+		return self.transport.pool
+
+	def perform ( self, method, path, headers, body = None ):
+		start = time.perf_counter()
+		rsp = self.transport.perform( method, path, headers, body )
+		data = rsp.read()
+		rsp.close()
+		exchange = Exchange( method, path, dict( headers ), _text( body ), rsp.status, rsp.reason,
+			[ ( name, value ) for name, value in rsp.getheaders() if name.lower() not in Exchange.droppedHeaders ],
+			_text( data ), time.perf_counter() - start )
+		self.recorder.write( exchange )
+
+		response = exchange.buffered()
+		response.timing = getattr( rsp, 'timing', None )
+		response.wireBytes, response.decodeTime = rsp.wireBytes, rsp.decodeTime
+		return response
+
+	def stats ( self ):
+		return self.transport.stats()
+
+	def close ( self ):
+		self.transport.close()
+
+
+class ReplayTransport:
+	'''Transport answering requests from a `CassettePlayer` without touching the network.'''
+
+	def __init__ ( self, player, instrumentation = None ):
+		self.player = player
+		self.instrumentation = instrumentation
+		self.responses = 0
+		self.bodyBytes = 0
+		self._lock = threading.Lock()
+
+	def perform ( self, method, path, headers, body = None ):
+		timing = self.instrumentation.start( method, path ) if self.instrumentation is not None else None
+		exchange = self.player.next( method, path, headers, body )
+		if self.player.latency:
+			time.sleep( exchange.time * self.player.latency )
+
+		response = exchange.buffered()
+		with self._lock:
+			self.responses += 1
+			self.bodyBytes += int( response.getheader( 'Content-Length' ) )
+		if timing is not None:
+			timing.status = exchange.status
+			timing.ttfb = time.perf_counter() - timing.start
+			timing.finish()
+		response.timing = timing
+		return response
+
+	def stats ( self ):
+		with self._lock:
+			return { 'hits' : self.responses, 'misses' : 0, 'idle' : 0, 'responses' : self.responses,
+				'wireBytes' : self.bodyBytes, 'bodyBytes' : self.bodyBytes, 'decodeTime' : 0.0 }
+
+	def close ( self ):
+		pass
+
+
+def openCassette ( fileName, mode = 'record', latency = 0.0 ):
+	'''Return a recorder for mode `record`, or a player replaying the cassette in `order` or `match` mode.'''
+	if mode == 'record':
+		return CassetteRecorder( fileName )
+	return CassettePlayer( fileName, mode, latency )
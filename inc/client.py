@@ -3,48 +3,154 @@
 OCCI client.
 '''
 
-from urllib.error import HTTPError, URLError
-from urllib.request import urlopen
+from concurrent.futures import ThreadPoolExecutor
+import asyncio, time
 
+from .metrics import pathTemplate
 from .occi import *
-from .util import Request, urlencodeData
+from .transport import AsyncHTTPTransport, HTTPTransport
+from .util import LRUCache, Request, percentile, urlencodeData
 
 class OCCIResponse:
-	'''OCCI response wrapper.'''
+	'''
+	OCCI response wrapper.
+	
+	Unless `stream` is set, the body is read and parsed completely on
+	construction. In streaming mode the body stays on the socket until it is
+	requested: `iterStructures` reads and parses it line by line, while `body`
+	and `structures` are only materialized on first access.
+	`timeToFirstStructure` is the time from the `start` of the request, taken
+	from its timing if instrumented, until the first structure was parsed.
+	'''
+	parseCache = LRUCache( 4096 )
 
-	def __init__ ( self, response ):
+	def __init__ ( self, response, stream = False, tracer = None, start = None ):
 		self.rsp  = response
 		self.info = response.info()
-		self.body = response.read().decode()
 		self.status = response.code
-
 		self.contentType = self.rsp.getheader( 'Content-Type' )
-		if self.contentType == 'text/uri-list':
-			self.uris = self.body.split( '\n\r' )
-		elif self.contentType == 'text/occi':
-			pass
-		else: # contentType == 'text/plain':
-			self.structures = [ self.parseStructure( line.strip() ) for line in self.body.strip().split( '\n' ) ]
+		self.timeToFirstStructure = None
+		self.timing = getattr( response, 'timing', None )
+		self._start = self.timing.start if self.timing is not None else start if start is not None else time.perf_counter()
+		self._body = None
+		self._structures = None
+		self._consumed = False
+
+		if self.contentType == 'text/occi':
+			start = time.perf_counter()
+			self._structures = parseHeaders( self.info )
+			self._firstStructure( self._structures )
+			if tracer is not None:
+				tracer.complete( 'parse headers', 'parse', start, time.perf_counter(), { 'structures' : len( self._structures ) } )
+		
+		# a text/occi body carries no structures, reading it releases the connection
+		if not stream or self.contentType == 'text/occi':
+			self._body = response.read().decode()
+			if self.contentType != 'text/uri-list' and self.contentType != 'text/occi':
+				start = time.perf_counter()
+				self._structures = [ self.parseStructure( line.strip() ) for line in self._body.strip().split( '\n' ) ]
+				end = time.perf_counter()
+				self._firstStructure( self._structures )
+				if self.timing is not None:
+					self.timing.addParse( end - start )
+				if tracer is not None:
+					tracer.complete( 'parse body', 'parse', start, end, { 'structures' : len( self._structures ) } )
+	
+	@property
+	def body ( self ):
+		'''Response body; read from the socket on first access in streaming mode.'''
+		if self._body is None:
+			if self._consumed:
+				raise ValueError( 'Response body was already consumed by iterStructures.' )
+			self._body = self.rsp.read().decode()
+		return self._body
+	
+	@property
+	def wireBytes ( self ):
+		'''Body bytes received on the wire so far, before decompression.'''
+		return getattr( self.rsp, 'wireBytes', None )
+	
+	@property
+	def decodeTime ( self ):
+		'''Seconds spent decompressing the body so far.'''
+		return getattr( self.rsp, 'decodeTime', None )
+	
+	@property
+	def uris ( self ):
+		if self.contentType != 'text/uri-list':
+			raise AttributeError( 'uris' )
+		return self.body.split( '\n\r' )
+	
+	@property
+	def structures ( self ):
+		'''Parsed structures; materialized on first access in streaming mode.'''
+		if self._structures is None:
+			if self.contentType == 'text/uri-list':
+				raise AttributeError( 'structures' )
+			self._structures = list( self.iterStructures() )
+		return self._structures
+	
+	def iterStructures ( self, strict = False ):
+		'''
+		Yield the structures of a `text/plain` response as they arrive, skipping
+		blank lines; `text/occi` structures are parsed from the header fields.
+		Unless the body has already been read, it is consumed from the socket
+		line by line and cannot be read again afterwards.
+		'''
+		if self._structures is not None:
+			yield from filter( lambda s: s != '', self._structures )
+			return
+		
+		lines = self._body.split( '\n' ) if self._body is not None else self._readLines()
+		parseTime = 0.0
+		for line in lines:
+			line = line.strip()
+			if line:
+				start = time.perf_counter()
+				structure = self.parseStructure( line, strict=strict )
+				parseTime += time.perf_counter() - start
+				self._firstStructure( ( structure, ) )
+				yield structure
+		
+		if self.timing is not None:
+			self.timing.addParse( parseTime )
+	
+	def _firstStructure ( self, structures ):
+		'''Note the time since the request started once the first structure is available.'''
+		if structures and self.timeToFirstStructure is None:
+			self.timeToFirstStructure = time.perf_counter() - self._start
+			if self.timing is not None:
+				self.timing.addFirstStructure( self.timeToFirstStructure )
+	
+	def _readLines ( self ):
+		self._consumed = True
+		while True:
+			line = self.rsp.readline()
+			if not line:
+				break
+			yield line.decode()
 	
 	def close ( self ):
 		'''Close the response.'''
 		self.rsp.close()
 	
-	@staticmethod
-	def parseStructure ( line, strict = False ):
-		'''Parse the structure in the given line.'''
-		if line.startswith( 'Category:' ):
-			return CategoryStructure.parse( line, strict=strict )
-		elif line.startswith( 'Link:' ):
-			return LinkStructure.parse( line, strict=strict )
-		elif line.startswith( 'X-OCCI-Location:' ) or line.startswith( 'Location:' ):
-			return LocationStructure.parse( line, strict=strict )
-		elif line.startswith( 'X-OCCI-Attribute:' ):
-			return AttributeStructure.parse( line, strict=strict )
-		elif strict and line != '':
-			raise TypeError( 'Invalid response data' )
-		else:
-			return line
+	@classmethod
+	def parseStructure ( cls, line, strict = False ):
+		'''
+		Parse the structure in the given line. Parsed lines are kept in the
+		`parseCache` LRU cache; callers always receive a private copy, so the
+		cached structures are never modified.
+		'''
+		cache = cls.parseCache
+		if cache is None:
+			return parseStructure( line, strict=strict )
+		
+		key = ( line, strict )
+		structure = cache.get( key )
+		if structure is None:
+			structure = parseStructure( line, strict=strict )
+			cache.put( key, structure )
+		return structure.copy() if isinstance( structure, OCCIStructure ) else structure
 
 class OCCIError ( Exception ):
 	'''OCCI error.'''
@@ -57,7 +163,37 @@ class OCCIError ( Exception ):
 		super().__init__( self, response )
 
 
-class OCCIClient:
+class BatchResult ( list ):
+	'''
+	Ordered results of `OCCIClient.batch`: an `OCCIResponse` or `OCCIError` per
+	request, plus the batch wall time and the individual request latencies.
+	'''
+
+	def __init__ ( self, results, wallTime, latencies ):
+		super().__init__( results )
+		self.wallTime = wallTime
+		self.latencies = latencies
+	
+	@property
+	def errors ( self ):
+		return [ result for result in self if isinstance( result, OCCIError ) ]
+	
+	@property
+	def throughput ( self ):
+		'''Requests per second.'''
+		return len( self ) / self.wallTime if self.wallTime else 0.0
+	
+	def summary ( self ):
+		latencies = sorted( self.latencies )
+		if not latencies:
+			return '0 requests'
+		return '{0} requests ({1} errors) in {2:.3f} s, {3:.1f} req/s; latency ms min {4:.1f}, p50 {5:.1f}, p90 {6:.1f}, p99 {7:.1f}, max {8:.1f}'.format(
+			len( self ), len( self.errors ), self.wallTime, self.throughput,
+			*( 1000 * v for v in ( latencies[0], percentile( latencies, 0.5 ), percentile( latencies, 0.9 ), percentile( latencies, 0.99 ), latencies[-1] ) ) )
+
+
+class BaseOCCIClient:
+	'''Request construction shared by the synchronous and the asynchronous client.'''
 	userAgent = 'occi-tent/1.0 python/3.2 OCCI/1.1'
 
 	def __init__ ( self, host, port ):
@@ -70,7 +206,11 @@ class OCCIClient:
 			path = '/' + path
 		return self.baseUrl + path
 	
-	def request ( self, method, path, accept = None, data = None, headerData = None ):
+	def prepareRequest ( self, method, path, accept = None, data = None, headerData = None ):
+		'''
+		Build the HTTP request for the given OCCI request arguments. Return the
+		HTTP method, the request path, the header dictionary and the body.
+		'''
 		method = method.upper()
 		url = self.makeUrl( path )
 		req = Request( url )
@@ -124,16 +264,180 @@ class OCCIClient:
 					# TODO: Check spec on this.
 					req.add_unredirected_header( 'Content-type', 'text/plain' )
 		
-		# perform request
+		return req.method, req.selector, dict( req.header_items() ), req.data
+
+
+class OCCIClient ( BaseOCCIClient ):
+	def __init__ ( self, host, port, poolSize = 4, idleTimeout = 30, timeout = None, cache = None, compression = True, compressMinSize = None, instrumentation = None ):
+		super().__init__( host, port )
+		self.transport = HTTPTransport( host, port, poolSize=poolSize, idleTimeout=idleTimeout, timeout=timeout,
+			compression=compression, compressMinSize=compressMinSize, instrumentation=instrumentation )
+		self.cache = cache
+		self.tracer = None
+	
+	@property
+	def instrumentation ( self ):
+		'''Request timing collector (`inc.metrics.Instrumentation`), or None if disabled.'''
+		return getattr( self.transport, 'instrumentation', None )
+	
+	@instrumentation.setter
+	def instrumentation ( self, instrumentation ):
+		self.transport.instrumentation = instrumentation
+	
+	def poolStats ( self ):
+		'''Return the connection pool hit and miss counts and the transfer totals.'''
+		return self.transport.stats()
+	
+	def close ( self ):
+		'''Close all idle pooled connections.'''
+		self.transport.close()
+	
+	def request ( self, method, path, accept = None, data = None, headerData = None, stream = False ):
+		if self.tracer is not None:
+			return self._tracedRequest( method, path, accept, data, headerData, stream )
+		
+		start = time.perf_counter()
+		method, selector, headers, body = self.prepareRequest( method, path, accept, data, headerData )
+		if self.cache is not None:
+			rsp = self._cachedPerform( method, selector, headers, body )
+		else:
+			rsp = self.transport.perform( method, selector, headers, body )
+		
+		if not 200 <= rsp.status < 300:
+			raise OCCIError( rsp )
+		return OCCIResponse( rsp, stream=stream, start=start )
+	
+	def _tracedRequest ( self, method, path, accept, data, headerData, stream ):
+		'''Perform a request recording a span for it, and for parsing its response, with the tracer.'''
+		start, status = time.perf_counter(), None
 		try:
-			return OCCIResponse( urlopen( req ) )
-		except HTTPError as e:
-			raise OCCIError( e )
+			method, selector, headers, body = self.prepareRequest( method, path, accept, data, headerData )
+			if self.cache is not None:
+				rsp = self._cachedPerform( method, selector, headers, body )
+			else:
+				rsp = self.transport.perform( method, selector, headers, body )
+			
+			status = rsp.status
+			if not 200 <= rsp.status < 300:
+				raise OCCIError( rsp )
+			return OCCIResponse( rsp, stream=stream, tracer=self.tracer, start=start )
+		finally:
+			self.tracer.complete( '{0} {1}'.format( method, pathTemplate( path ) ), 'request', start, time.perf_counter(), { 'path' : path, 'status' : status } )
+	
+	def batch ( self, requests, workers = None ):
+		'''
+		Dispatch the given requests concurrently over at most `workers` threads
+		(default: the connection pool size, or 4) and return a `BatchResult` in request
+		order. Each request is a sequence of positional or a dict of keyword
+		arguments to `request`. Failed OCCI requests are returned as `OCCIError`
+		in place; any other exception is raised once the batch has finished.
+		'''
+		requests = list( requests )
+		latencies = [ None ] * len( requests )
+		instrumentation = self.instrumentation
+		case = instrumentation.case if instrumentation is not None else None
+		
+		def perform ( i ):
+			spec = requests[i]
+			if instrumentation is not None:
+				instrumentation.case = case
+			start = time.perf_counter()
+			try:
+				return self.request( **spec ) if isinstance( spec, dict ) else self.request( *spec )
+			except OCCIError as e:
+				return e
+			finally:
+				latencies[i] = time.perf_counter() - start
+		
+		start = time.perf_counter()
+		pool = getattr( self.transport, 'pool', None )
+		with ThreadPoolExecutor( max_workers=workers or ( pool.size if pool is not None else 4 ) ) as executor:
+			futures = [ executor.submit( perform, i ) for i in range( len( requests ) ) ]
+		results = [ future.result() for future in futures ]
+		return BatchResult( results, time.perf_counter() - start, latencies )
+	
+	def _cachedPerform ( self, method, selector, headers, body ):
+		'''Perform the request through the HTTP cache.'''
+		if method != 'GET':
+			self.cache.invalidate( selector )
+			return self.transport.perform( method, selector, headers, body )
+		
+		entry = self.cache.lookup( selector, headers )
+		requestHeaders = dict( headers, **entry.conditionalHeaders() ) if entry else headers
+		rsp = self.transport.perform( method, selector, requestHeaders, body )
+		
+		if rsp.status == 304 and entry:
+			rsp.read()
+			rsp.close()
+			self.cache.countHit()
+			return self._measured( entry.response(), rsp )
+		
+		self.cache.countMiss()
+		if rsp.status == 200:
+			response = self.cache.store( selector, headers, rsp )
+			return response if response is rsp else self._measured( response, rsp )
+		return rsp
+	
+	@staticmethod
+	def _measured ( response, rsp ):
+		'''Carry the timing and transfer figures of a transport response over to the response replacing it.'''
+		response.timing = getattr( rsp, 'timing', None )
+		response.wireBytes, response.decodeTime = getattr( rsp, 'wireBytes', None ), getattr( rsp, 'decodeTime', None )
+		return response
 	
-
 	## deprecated
 	def open ( self, path, method = 'GET', data = None, accept = None, inHead = False ):
 		if inHead:
 			return self.request( method, path, accept = accept, headerData = data )
 		else:
-			return self.request( method, path, accept = accept, data = data )
\ No newline at end of file
+			return self.request( method, path, accept = accept, data = data )
+
+
+class AsyncOCCIClient ( BaseOCCIClient ):
+	'''
+	Asynchronous OCCI client. `request` is a coroutine with the same arguments
+	and results as `OCCIClient.request`; at most `concurrency` requests are in
+	flight at the same time, any further requests wait for a free slot.
+	'''
+
+	def __init__ ( self, host, port, concurrency = 16, idleTimeout = 30, timeout = None ):
+		super().__init__( host, port )
+		self.transport = AsyncHTTPTransport( host, port, concurrency=concurrency, idleTimeout=idleTimeout, timeout=timeout )
+	
+	async def request ( self, method, path, accept = None, data = None, headerData = None, stream = False ):
+		start = time.perf_counter()
+		rsp = await self.transport.perform( *self.prepareRequest( method, path, accept, data, headerData ) )
+		if not 200 <= rsp.status < 300:
+			raise OCCIError( rsp )
+		return OCCIResponse( rsp, stream=stream, start=start )
+	
+	async def batch ( self, requests ):
+		'''
+		Dispatch the given requests concurrently, at most `concurrency` at a
+		time, and return a `BatchResult` in request order, like
+		`OCCIClient.batch`. Failed OCCI requests are returned as `OCCIError` in
+		place; any other exception is raised once the batch has finished.
+		'''
+		requests = list( requests )
+		latencies = [ None ] * len( requests )
+		
+		async def perform ( i ):
+			spec = requests[i]
+			start = time.perf_counter()
+			try:
+				return await ( self.request( **spec ) if isinstance( spec, dict ) else self.request( *spec ) )
+			except OCCIError as e:
+				return e
+			finally:
+				latencies[i] = time.perf_counter() - start
+		
+		start = time.perf_counter()
+		results = await asyncio.gather( *( perform( i ) for i in range( len( requests ) ) ), return_exceptions=True )
+		for result in results:
+			if isinstance( result, BaseException ) and not isinstance( result, OCCIError ):
+				raise result
+		return BatchResult( results, time.perf_counter() - start, latencies )
+	
+	async def close ( self ):
+		'''Close all idle connections.'''
+		await self.transport.close()
@@ -0,0 +1,658 @@
+#!/usr/bin/env python3
+'''
+OCCI tent load generation from test modules.
+'''
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import csv, json, math, re, threading, time
+
+from .client import OCCIError
+from .metrics import Histogram, Instrumentation, pathTemplate
+from .occi import parseStructure
+from .tester import Tester
+
+__all__ = [ 'CapacitySearch', 'LoadGenerator', 'LoadResult', 'RateGenerator', 'RateResult', 'ReplayResult', 'ServiceLevel',
+	'TrafficReplay', 'histogramLines', 'logRequest', 'moduleCall', 'readRequestLog', 'requestCall' ]
+
+_objectivePattern = re.compile( r'^\s*(p\d+(?:\.\d+)?|mean|max|errors)\s*<\s*(\d+(?:\.\d+)?)\s*(ms|s|%)?\s*$' )
+
+def histogramLines ( histogram, rows = 8, width = 40 ):
+	'''Render a histogram of durations as text bars over logarithmically sized ranges, in ms.'''
+	if not histogram.count:
+		return []
+	low, high = math.log( histogram.min ), math.log( histogram.max )
+	step = ( high - low ) / rows or 1.0
+	counts = [ 0 ] * rows
+	for index, count in histogram.counts.items():
+		value = histogram.minValue * histogram.growth ** index
+		row = min( rows - 1, max( 0, int( ( math.log( max( value, histogram.min ) ) - low ) / step ) ) )
+		counts[row] += count
+
+	lines = []
+	peak = max( counts )
+	for row, count in enumerate( counts ):
+		upper = math.exp( low + ( row + 1 ) * step ) if row < rows - 1 else histogram.max
+		lines.append( '  <= {0:9.1f} ms {1:>7} {2}'.format( upper * 1000, count, '#' * round( width * count / peak ) ) )
+	return lines
+
+
+class LoadResult:
+	'''Outcome of a load run over a test module.'''
+
+	def __init__ ( self, name, concurrency ):
+		self.name = name
+		self.concurrency = concurrency
+		self.calls = 0
+		self.failures = 0
+		self.skips = 0
+		self.messages = {}
+		self.wallTime = 0.0
+		self.moduleLatency = Histogram()
+		self.requestLatency = Histogram()
+
+	@property
+	def throughput ( self ):
+		return self.calls / self.wallTime if self.wallTime else 0.0
+
+	@property
+	def requestThroughput ( self ):
+		return self.requestLatency.count / self.wallTime if self.wallTime else 0.0
+
+	@property
+	def errorRate ( self ):
+		return self.failures / self.calls if self.calls else 0.0
+
+	@property
+	def skipRate ( self ):
+		return self.skips / self.calls if self.calls else 0.0
+
+	def summary ( self ):
+		'''Return the report lines of the run.'''
+		lines = [ 'Load: {0} calls of `{1}` in {2:.2f} s with {3} workers: {4:.1f} calls/s, {5:.1%} errors, {6:.1%} skipped.'.format(
+			self.calls, self.name, self.wallTime, self.concurrency, self.throughput, self.errorRate, self.skipRate ) ]
+		for label, histogram, rate in ( ( 'Module calls', self.moduleLatency, self.throughput ), ( 'HTTP requests', self.requestLatency, self.requestThroughput ) ):
+			if not histogram.count:
+				continue
+			lines.append( '{0}: n={1}, {2:.1f}/s, ms p50/p90/p99/max {3:.1f}/{4:.1f}/{5:.1f}/{6:.1f}'.format(
+				label, histogram.count, rate, *( 1000 * histogram.percentile( f ) for f in ( 0.5, 0.9, 0.99 ) ), 1000 * histogram.max ) )
+			lines.extend( histogramLines( histogram ) )
+		for message, count in sorted( self.messages.items(), key=lambda item: -item[1] )[:5]:
+			lines.append( '  {0}x {1}'.format( count, message ) )
+		return lines
+
+
+class LoadGenerator:
+	'''
+	Repeatedly call a test module on `concurrency` workers, each with its own
+	`Tester` and client created by `makeClient( instrumentation )`. The run
+	stops after `requests` module calls or after `duration` seconds.
+	'''
+
+	def __init__ ( self, makeClient, module, name = None, parameters = None, concurrency = 1 ):
+		self.makeClient = makeClient
+		self.module = module
+		self.name = name or getattr( module, '__name__', str( module ) )
+		self.parameters = parameters or {}
+		self.concurrency = concurrency
+
+	def run ( self, requests = None, duration = None ):
+		if requests is None and duration is None:
+			raise ValueError( 'Either a number of requests or a duration is required' )
+
+		result = LoadResult( self.name, self.concurrency )
+		instrumentation = Instrumentation()
+		lock = threading.Lock()
+		issued = [ 0 ]
+		deadline = time.perf_counter() + duration if duration is not None else None
+
+		def work ():
+			client = self.makeClient( instrumentation )
+			tester = Tester( client, keepTests=False )
+			latency = Histogram()
+			calls, failures, skips, messages = 0, 0, 0, {}
+			try:
+				while True:
+					if deadline is not None and time.perf_counter() >= deadline:
+						break
+					if requests is not None:
+						with lock:
+							if issued[0] >= requests:
+								break
+							issued[0] += 1
+
+					tester.start( self.name )
+					start = time.perf_counter()
+					tester.run( self.module, args=dict( self.parameters ) )
+					latency.add( time.perf_counter() - start )
+
+					calls += 1
+					t = tester.current
+					if t['failed'] or t['skipped']:
+						if t['failed']:
+							failures += 1
+						else:
+							skips += 1
+						message = t['log'][-1].message if t['log'] else ''
+						messages[message] = messages.get( message, 0 ) + 1
+			finally:
+				client.close()
+				with lock:
+					result.calls += calls
+					result.failures += failures
+					result.skips += skips
+					result.moduleLatency.merge( latency )
+					for message, count in messages.items():
+						result.messages[message] = result.messages.get( message, 0 ) + count
+
+		threads = [ threading.Thread( name='LoadWorker-{0}'.format( i ), target=work ) for i in range( self.concurrency ) ]
+		start = time.perf_counter()
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		result.wallTime = time.perf_counter() - start
+
+		for phases in instrumentation.histograms().values():
+			result.requestLatency.merge( phases['total'] )
+		return result
+
+
+def moduleCall ( module, name, parameters = None ):
+	'''Return a workload calling a test module through `Tester.run`; it returns `'failed'`, `'skipped'` or None.'''
+	def call ( tester ):
+		tester.start( name )
+		tester.run( module, args=dict( parameters or {} ) )
+		t = tester.current
+		return 'failed' if t['failed'] else 'skipped' if t['skipped'] else None
+	return call
+
+def requestCall ( method, path, **kwargs ):
+	'''Return a workload performing a single OCCI request; it returns `'failed'` or None.'''
+	def call ( tester ):
+		try:
+			tester.client.request( method, path, **kwargs )
+		except OCCIError:
+			return 'failed'
+	return call
+
+
+class RateResult:
+	'''
+	Outcome of an open-loop run. `latency` is measured from the intended start
+	of each call and so includes any time the call waited behind earlier ones,
+	`service` only from its actual start. `series` holds one row per interval.
+	Throughput is taken over the whole `duration` of the run, or the wall time
+	if the last calls completed after it.
+	'''
+
+	def __init__ ( self, name, interval, duration = 0.0 ):
+		self.name = name
+		self.interval = interval
+		self.duration = duration
+		self.calls = 0
+		self.failures = 0
+		self.skips = 0
+		self.wallTime = 0.0
+		self.maxLag = 0.0
+		self.latency = Histogram()
+		self.service = Histogram()
+		self.series = []
+
+	def bucket ( self, index ):
+		while len( self.series ) <= index:
+			self.series.append( { 'time' : len( self.series ) * self.interval, 'rate' : 0.0, 'issued' : 0,
+				'completed' : 0, 'errors' : 0, 'skipped' : 0, 'latency' : Histogram() } )
+		return self.series[index]
+
+	@property
+	def throughput ( self ):
+		elapsed = max( self.duration, self.wallTime )
+		return self.calls / elapsed if elapsed else 0.0
+
+	@property
+	def errorRate ( self ):
+		return self.failures / self.calls if self.calls else 0.0
+
+	def summary ( self ):
+		'''Return the report lines of the run.'''
+		lines = [ 'Rate: {0} calls of `{1}` in {2:.2f} s: {3:.1f} calls/s, {4:.1%} errors, {5} skipped; dispatcher lag up to {6:.1f} ms.'.format(
+			self.calls, self.name, self.wallTime, self.throughput, self.errorRate, self.skips, self.maxLag * 1000 ) ]
+		for label, histogram in ( ( 'Latency from intended start', self.latency ), ( 'Service time', self.service ) ):
+			if histogram.count:
+				lines.append( '{0}: ms p50/p90/p99/p99.9/max {1:.1f}/{2:.1f}/{3:.1f}/{4:.1f}/{5:.1f}'.format(
+					label, *( 1000 * histogram.percentile( f ) for f in ( 0.5, 0.9, 0.99, 0.999 ) ), 1000 * histogram.max ) )
+		lines.extend( histogramLines( self.latency ) )
+		return lines
+
+	def writeSeries ( self, file ):
+		'''Write the time series as CSV: per interval the target rate, calls issued and completed, errors and corrected latencies.'''
+		writer = csv.writer( file )
+		writer.writerow( ( 'time', 'target_rate', 'issued', 'completed', 'throughput', 'errors', 'skipped', 'p50_ms', 'p99_ms', 'max_ms' ) )
+		for row in self.series:
+			latency = row['latency']
+			writer.writerow( ( '{0:g}'.format( row['time'] ), '{0:.1f}'.format( row['rate'] ), row['issued'], row['completed'],
+				'{0:.1f}'.format( row['completed'] / self.interval ), row['errors'], row['skipped'],
+				*( '{0:.2f}'.format( 1000 * v ) if v is not None else '' for v in ( latency.percentile( 0.5 ), latency.percentile( 0.99 ), latency.max ) ) ) )
+
+
+class RateGenerator:
+	'''
+	Open-loop load: start calls of a workload at a fixed arrival rate, or at a
+	rate ramping linearly from `rate` to `endRate` over `duration` seconds,
+	regardless of how long earlier calls take. Calls run on up to `workers`
+	threads, each with its own `Tester` and client; calls that find no free
+	worker wait, and that wait counts towards their latency.
+	'''
+
+	def __init__ ( self, makeClient, call, name, rate, endRate = None, duration = 60, workers = 64, interval = 1.0 ):
+		if rate <= 0 or ( endRate is not None and endRate <= 0 ):
+			raise ValueError( 'Arrival rates must be positive' )
+		self.makeClient = makeClient
+		self.call = call
+		self.name = name
+		self.rate = rate
+		self.endRate = rate if endRate is None else endRate
+		self.duration = duration
+		self.workers = workers
+		self.interval = interval
+
+	def rateAt ( self, offset ):
+		'''Target arrival rate at the given offset in seconds.'''
+		return self.rate + ( self.endRate - self.rate ) * offset / self.duration
+
+	def arrivals ( self ):
+		'''Yield the intended start offsets of all calls.'''
+		slope = ( self.endRate - self.rate ) / self.duration
+		k = 0
+		while True:
+			if slope:
+				offset = ( math.sqrt( self.rate ** 2 + 2 * slope * k ) - self.rate ) / slope
+			else:
+				offset = k / self.rate
+			if offset >= self.duration:
+				return
+			yield offset
+			k += 1
+
+	def run ( self ):
+		result = RateResult( self.name, self.interval, self.duration )
+		lock = threading.Lock()
+		local = threading.local()
+		clients = []
+
+		def work ( intended, offset ):
+			tester = getattr( local, 'tester', None )
+			if tester is None:
+				client = self.makeClient()
+				with lock:
+					clients.append( client )
+				tester = local.tester = Tester( client, keepTests=False )
+
+			begin = time.perf_counter()
+			try:
+				outcome = self.call( tester )
+			except Exception:
+				outcome = 'failed'
+			end = time.perf_counter()
+
+			with lock:
+				result.calls += 1
+				result.latency.add( end - intended )
+				result.service.add( end - begin )
+				row = result.bucket( int( offset / self.interval ) )
+				row['latency'].add( end - intended )
+				if outcome == 'failed':
+					result.failures += 1
+					row['errors'] += 1
+				elif outcome == 'skipped':
+					result.skips += 1
+					row['skipped'] += 1
+				result.bucket( int( ( end - start ) / self.interval ) )['completed'] += 1
+
+		for index in range( math.ceil( self.duration / self.interval ) ):
+			result.bucket( index )['rate'] = self.rateAt( ( index + 0.5 ) * self.interval )
+
+		with ThreadPoolExecutor( max_workers=self.workers ) as executor:
+			start = time.perf_counter()
+			for offset in self.arrivals():
+				intended = start + offset
+				delay = intended - time.perf_counter()
+				if delay > 0:
+					time.sleep( delay )
+				else:
+					result.maxLag = max( result.maxLag, -delay )
+				with lock:
+					result.bucket( int( offset / self.interval ) )['issued'] += 1
+				executor.submit( work, intended, offset )
+		result.wallTime = time.perf_counter() - start
+
+		for client in clients:
+			client.close()
+		return result
+
+
+class ServiceLevel:
+	'''
+	Service level objective over the results of a rate run, parsed from text
+	like `p99<200ms,errors<1%`. Latency objectives use `pNN`, `mean` or `max`
+	with a unit of `ms` or `s` and apply to latencies from the intended start;
+	`errors` is the maximum failure rate. Without an error objective, no
+	errors are allowed above 1%.
+	'''
+
+	def __init__ ( self, text ):
+		self.text = text
+		self.objectives = []
+		self.maxErrorRate = 0.01
+		for part in text.split( ',' ):
+			match = _objectivePattern.match( part )
+			if not match:
+				raise ValueError( 'Invalid service level objective `{0}`'.format( part.strip() ) )
+			metric, limit, unit = match.group( 1 ), float( match.group( 2 ) ), match.group( 3 )
+			if metric == 'errors':
+				self.maxErrorRate = limit / 100 if unit == '%' else limit
+			elif unit == '%':
+				raise ValueError( 'Latency objective `{0}` needs a unit of ms or s'.format( part.strip() ) )
+			else:
+				self.objectives.append( ( metric, limit / 1000 if unit != 's' else limit ) )
+
+	def measure ( self, result, metric ):
+		if metric == 'mean':
+			return result.latency.mean
+		if metric == 'max':
+			return result.latency.max
+		return result.latency.percentile( float( metric[1:] ) / 100 )
+
+	def violations ( self, result ):
+		'''Return descriptions of all objectives the result does not meet.'''
+		violations = []
+		if not result.calls:
+			return [ 'no calls completed' ]
+		for metric, limit in self.objectives:
+			value = self.measure( result, metric )
+			if value is None or value >= limit:
+				violations.append( '{0} {1:.1f} ms >= {2:.1f} ms'.format( metric, 1000 * ( value or 0 ), 1000 * limit ) )
+		if result.errorRate > self.maxErrorRate:
+			violations.append( 'errors {0:.1%} > {1:.1%}'.format( result.errorRate, self.maxErrorRate ) )
+		return violations
+
+	def __str__ ( self ):
+		return self.text
+
+
+class CapacitySearch:
+	'''
+	Search the highest arrival rate meeting a `ServiceLevel`. `probe( rate )`
+	runs a load step at the given rate and returns its `RateResult`. The rate
+	doubles from `startRate` until a step misses the objective, then the range
+	between the last passing and first failing rate is bisected until it is
+	narrower than `precision` of the failing rate. If `startRate` already
+	fails, `minRate` is probed as the lower end; the search gives up if that
+	fails too.
+	'''
+
+	def __init__ ( self, probe, serviceLevel, startRate = 10, maxRate = 10000, minRate = 1.0, precision = 0.05, report = None ):
+		if minRate <= 0:
+			raise ValueError( 'Arrival rates must be positive' )
+		self.probe = probe
+		self.serviceLevel = serviceLevel
+		self.startRate = startRate
+		self.maxRate = maxRate
+		self.minRate = minRate
+		self.precision = precision
+		self.report = report
+		self.steps = []
+
+	def step ( self, rate ):
+		result = self.probe( rate )
+		violations = self.serviceLevel.violations( result )
+		self.steps.append( ( rate, result, violations ) )
+		if self.report:
+			self.report( '{0:8.1f}/s: {1} ({2:.1f} calls/s, p99 {3:.1f} ms, {4:.1%} errors)'.format(
+				rate, 'FAIL ' + '; '.join( violations ) if violations else 'pass', result.throughput,
+				1000 * ( result.latency.percentile( 0.99 ) or 0 ), result.errorRate ) )
+		return not violations
+
+	def run ( self ):
+		'''Return the highest passing rate found, or None if even the lowest probed rate failed.'''
+		low, high = None, None
+		rate = self.startRate
+		while rate <= self.maxRate:
+			if not self.step( rate ):
+				high = rate
+				break
+			low = rate
+			rate *= 2
+		if high is None:
+			return low
+
+		if low is None:
+			if high <= self.minRate or not self.step( self.minRate ):
+				return None
+			low = self.minRate
+
+		bottom = low
+		while high - bottom > self.precision * high:
+			rate = ( bottom + high ) / 2
+			if self.step( rate ):
+				bottom = low = rate
+			else:
+				high = rate
+		return low
+
+
+def readRequestLog ( file ):
+	'''
+	Yield the entries of a JSON Lines request log, given as file name or open
+	file, one line at a time. An entry has a `method` and `path` and may have
+	an `accept` type, `headers`, OCCI header `structures` as rendering lines,
+	a `body`, the recorded response `status` and a `timestamp` in seconds or
+	ISO 8601. Records without a `method`, like the seed line of a cassette,
+	are skipped; cassettes written by `inc.cassette` are valid request logs.
+	'''
+	f = open( file ) if isinstance( file, str ) else file
+	try:
+		for number, line in enumerate( f, 1 ):
+			if not line.strip():
+				continue
+			try:
+				entry = json.loads( line )
+			except ValueError as e:
+				raise ValueError( 'Invalid request log line {0}: {1}'.format( number, e ) )
+			if isinstance( entry, dict ) and 'method' in entry:
+				yield entry
+	finally:
+		if f is not file:
+			f.close()
+
+def _timestamp ( value ):
+	'''Return a timestamp in seconds or ISO 8601 as seconds, or raise `ValueError` if it is malformed.'''
+	if value is None or isinstance( value, ( int, float ) ):
+		return value
+	if not isinstance( value, str ):
+		raise ValueError( 'Invalid timestamp {0!r}'.format( value ) )
+	# fromisoformat only accepts a trailing `Z` from Python 3.11 on
+	if value[-1:] in ( 'Z', 'z' ):
+		value = value[:-1] + '+00:00'
+	return datetime.fromisoformat( value ).timestamp()
+
+_replayIgnoredHeaders = frozenset( ( 'user-agent', 'accept', 'accept-encoding', 'content-length', 'host' ) )
+
+def logRequest ( entry ):
+	'''Map a request log entry onto the keyword arguments of `OCCIClient.request`.'''
+	headers = entry.get( 'headers' ) or {}
+	accept = entry.get( 'accept' ) or next( ( value for name, value in headers.items() if name.lower() == 'accept' ), None )
+	headerData = [ parseStructure( line, strict=True ) for line in entry.get( 'structures' ) or () ]
+	headers = { name : value for name, value in headers.items() if name.lower() not in _replayIgnoredHeaders }
+	if headers:
+		headerData.append( headers )
+	return { 'method' : entry['method'], 'path' : entry['path'], 'accept' : accept, 'data' : entry.get( 'body' ), 'headerData' : headerData or None }
+
+
+class ReplayResult:
+	'''
+	Outcome of a traffic replay. Latencies are measured from the intended start
+	of each request, per endpoint of method and path template. Responses are
+	compared with the recorded status where the log has one. Entries that
+	cannot be replayed are skipped and reported.
+	'''
+
+	def __init__ ( self, name, workers ):
+		self.name = name
+		self.workers = workers
+		self.calls = 0
+		self.errors = 0
+		self.skipped = 0
+		self.compared = 0
+		self.wallTime = 0.0
+		self.maxLag = 0.0
+		self.latency = Histogram()
+		self.endpoints = {}
+		self.statuses = {}
+		self.mismatches = {}
+		self.messages = {}
+
+	@property
+	def throughput ( self ):
+		return self.calls / self.wallTime if self.wallTime else 0.0
+
+	@property
+	def mismatchCount ( self ):
+		return sum( self.mismatches.values() )
+
+	def add ( self, endpoint, latency, status, recorded, message = None ):
+		self.calls += 1
+		self.latency.add( latency )
+		if endpoint not in self.endpoints:
+			self.endpoints[endpoint] = Histogram()
+		self.endpoints[endpoint].add( latency )
+		self.statuses[status] = self.statuses.get( status, 0 ) + 1
+		if status is None:
+			self.errors += 1
+			self.messages[message] = self.messages.get( message, 0 ) + 1
+		if recorded is not None:
+			self.compared += 1
+			if status != recorded:
+				key = ( endpoint, recorded, status )
+				self.mismatches[key] = self.mismatches.get( key, 0 ) + 1
+
+	def skip ( self, message ):
+		self.skipped += 1
+		self.messages[message] = self.messages.get( message, 0 ) + 1
+
+	def summary ( self, endpoints = 20 ):
+		'''Return the report lines of the run.'''
+		lines = [ 'Replay: {0} requests from `{1}` in {2:.2f} s with {3} workers: {4:.1f} requests/s, {5} errors, {7} entries skipped; dispatcher lag up to {6:.1f} ms.'.format(
+			self.calls, self.name, self.wallTime, self.workers, self.throughput, self.errors, self.maxLag * 1000, self.skipped ) ]
+		lines.append( 'Statuses: ' + ', '.join( '{0} x{1}'.format( status or 'none', count ) for status, count in sorted( self.statuses.items(), key=lambda item: item[0] or 0 ) ) )
+		if self.compared:
+			lines.append( 'Status mismatches: {0} of {1} compared requests ({2:.1%}).'.format( self.mismatchCount, self.compared, self.mismatchCount / self.compared ) )
+			for ( endpoint, recorded, status ), count in sorted( self.mismatches.items(), key=lambda item: -item[1] )[:10]:
+				lines.append( '  {0}x {1}: recorded {2}, got {3}'.format( count, endpoint, recorded, status or 'no response' ) )
+		if self.latency.count:
+			lines.append( 'Latency from intended start: ms p50/p90/p99/p99.9/max {0:.1f}/{1:.1f}/{2:.1f}/{3:.1f}/{4:.1f}'.format(
+				*( 1000 * self.latency.percentile( f ) for f in ( 0.5, 0.9, 0.99, 0.999 ) ), 1000 * self.latency.max ) )
+			lines.append( '  {0:<40} {1:>7} {2:>8} {3:>8} {4:>8} {5:>8}'.format( 'endpoint', 'n', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms' ) )
+			for endpoint, histogram in sorted( self.endpoints.items(), key=lambda item: -item[1].count )[:endpoints]:
+				lines.append( '  {0:<40} {1:>7} {2:8.1f} {3:8.1f} {4:8.1f} {5:8.1f}'.format( endpoint, histogram.count,
+					*( 1000 * histogram.percentile( f ) for f in ( 0.5, 0.9, 0.99 ) ), 1000 * histogram.max ) )
+		for message, count in sorted( self.messages.items(), key=lambda item: -item[1] )[:5]:
+			lines.append( '  {0}x {1}'.format( count, message ) )
+		return lines
+
+
+class TrafficReplay:
+	'''
+	Open-loop replay of a request log against the client's server. Requests
+	start at their recorded offsets divided by `speed`, or at a fixed
+	`maxRate` per second, on up to `workers` threads with their own clients;
+	entries without timestamps start as soon as a worker is free. The log is
+	read while replaying and only entries on their way to a free worker are
+	held; a request that has to wait for one still counts from its intended
+	start.
+	'''
+
+	def __init__ ( self, makeClient, entries, name, speed = 1.0, maxRate = None, workers = 16 ):
+		if speed <= 0 or ( maxRate is not None and maxRate <= 0 ):
+			raise ValueError( 'Replay speed and rate must be positive' )
+		self.makeClient = makeClient
+		self.entries = entries
+		self.name = name
+		self.speed = speed
+		self.maxRate = maxRate
+		self.workers = workers
+
+	def schedule ( self, result = None ):
+		'''
+		Yield the intended start offsets, or None to start as soon as possible,
+		and entries of all requests. Entries with a malformed timestamp are
+		skipped and reported to `result`.
+		'''
+		first = None
+		for k, entry in enumerate( self.entries ):
+			if self.maxRate is not None:
+				yield k / self.maxRate, entry
+				continue
+			try:
+				timestamp = _timestamp( entry.get( 'timestamp' ) )
+			except ValueError as e:
+				if result is not None:
+					result.skip( 'Entry {0} ({1} {2}) skipped: {3}'.format( k + 1, entry.get( 'method', '?' ).upper(), entry.get( 'path', '' ), e ) )
+				continue
+			if timestamp is None:
+				yield None, entry
+				continue
+			if first is None:
+				first = timestamp
+			yield max( 0.0, timestamp - first ) / self.speed, entry
+
+	def run ( self ):
+		result = ReplayResult( self.name, self.workers )
+		lock = threading.Lock()
+		local = threading.local()
+		slots = threading.BoundedSemaphore( self.workers )
+		clients = []
+
+		def work ( intended, entry ):
+			try:
+				client = getattr( local, 'client', None )
+				if client is None:
+					client = local.client = self.makeClient()
+					with lock:
+						clients.append( client )
+
+				status, message = None, None
+				try:
+					status = client.request( **logRequest( entry ) ).status
+				except OCCIError as e:
+					status = e.status
+				except Exception as e:
+					message = '{0}: {1}'.format( type( e ).__name__, e )
+				end = time.perf_counter()
+
+				with lock:
+					result.add( '{0} {1}'.format( entry.get( 'method', '?' ).upper(), pathTemplate( entry.get( 'path', '' ) ) ),
+						end - intended, status, entry.get( 'status' ), message )
+			finally:
+				slots.release()
+
+		with ThreadPoolExecutor( max_workers=self.workers ) as executor:
+			start = time.perf_counter()
+			for offset, entry in self.schedule( result ):
+				if offset is None:
+					slots.acquire()
+					intended = time.perf_counter()
+				else:
+					intended = start + offset
+					delay = intended - time.perf_counter()
+					if delay > 0:
+						time.sleep( delay )
+					slots.acquire()
+					result.maxLag = max( result.maxLag, time.perf_counter() - intended )
+				executor.submit( work, intended, entry )
+		result.wallTime = time.perf_counter() - start
+
+		for client in clients:
+			client.close()
+		return result
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+'''
+OCCI tent request instrumentation.
+'''
+
+import io, math, re, threading, time
+
+__all__ = [ 'Histogram', 'Instrumentation', 'ModuleStats', 'ModuleTimer', 'RequestTiming', 'pathTemplate' ]
+
+_idSegment = re.compile( r'^(?:\d+|[0-9a-fA-F-]{8,}|[0-9a-fA-F]{16,})$' )
+
+def pathTemplate ( path ):
+	'''Replace instance identifiers in a request path, e.g. `/storage/42` becomes `/storage/{id}`.'''
+	path = path.split( '?', 1 )[0]
+	return '/'.join( '{id}' if _idSegment.match( segment ) else segment for segment in path.split( '/' ) )
+
+
+class Histogram:
+	'''
+	Log-linear histogram of durations in seconds. Values are counted in
+	buckets growing by `growth`, so percentiles are exact to within about
+	2% while recording stays a constant-time dictionary increment.
+	'''
+	__slots__ = ( 'counts', 'count', 'total', 'min', 'max' )
+	minValue = 1e-6
+	growth = 1.02
+	_logGrowth = math.log( growth )
+
+	def __init__ ( self ):
+		self.counts = {}
+		self.count = 0
+		self.total = 0.0
+		self.min = None
+		self.max = None
+
+	def add ( self, value ):
+		index = int( math.log( value / self.minValue ) / self._logGrowth ) if value > self.minValue else 0
+		self.counts[index] = self.counts.get( index, 0 ) + 1
+		self.count += 1
+		self.total += value
+		if self.min is None or value < self.min:
+			self.min = value
+		if self.max is None or value > self.max:
+			self.max = value
+
+	def merge ( self, other ):
+		for index, count in other.counts.items():
+			self.counts[index] = self.counts.get( index, 0 ) + count
+		self.count += other.count
+		self.total += other.total
+		if other.count:
+			self.min = other.min if self.min is None else min( self.min, other.min )
+			self.max = other.max if self.max is None else max( self.max, other.max )
+
+	def percentile ( self, fraction ):
+		'''Return the upper bound of the bucket holding the given fraction (0..1) of values.'''
+		if not self.count:
+			return None
+		rank = max( 1, math.ceil( fraction * self.count ) )
+		seen = 0
+		for index in sorted( self.counts ):
+			seen += self.counts[index]
+			if seen >= rank:
+				return min( self.max, max( self.min, self.minValue * self.growth ** ( index + 1 ) ) )
+		return self.max
+
+	@property
+	def mean ( self ):
+		return self.total / self.count if self.count else None
+
+
+class RequestTiming:
+	'''Phase durations of a single request, in seconds.'''
+	__slots__ = ( 'collector', 'case', 'method', 'template', 'status', 'start', 'dns', 'connect', 'ttfb', 'body' )
+
+	def __init__ ( self, collector, case, method, path ):
+		self.collector = collector
+		self.case = case
+		self.method = method
+		self.template = pathTemplate( path )
+		self.status = None
+		self.start = time.perf_counter()
+		self.dns = 0.0
+		self.connect = 0.0
+		self.ttfb = 0.0
+		self.body = 0.0
+
+	def finish ( self ):
+		'''Record the transfer phases once the body has been received.'''
+		self.collector.record( self )
+
+	def addParse ( self, seconds ):
+		'''Record the time spent parsing the response.'''
+		self.collector.recordParse( self, seconds )
+
+	def addFirstStructure ( self, seconds ):
+		'''Record the time from the request start to the first parsed structure.'''
+		self.collector.recordFirstStructure( self, seconds )
+
+
+class Instrumentation:
+	'''
+	Collector of request timings. Requests are tagged with the current test
+	case of the calling thread, method, path template and status, and each
+	phase is aggregated into a `Histogram`.
+	'''
+	phases = ( 'total', 'dns', 'connect', 'ttfb', 'body', 'parse', 'first' )
+
+	def __init__ ( self ):
+		self._local = threading.local()
+		self._lock = threading.Lock()
+		self._histograms = {}
+		self._cases = []
+
+	@property
+	def case ( self ):
+		'''Test case title requests of the current thread are tagged with.'''
+		return getattr( self._local, 'case', None )
+
+	@case.setter
+	def case ( self, title ):
+		self._local.case = title
+		with self._lock:
+			if title not in self._cases:
+				self._cases.append( title )
+
+	def start ( self, method, path ):
+		return RequestTiming( self, self.case, method, path )
+
+	def _phases ( self, timing ):
+		key = ( timing.case, timing.method, timing.template, timing.status )
+		phases = self._histograms.get( key )
+		if phases is None:
+			phases = self._histograms[key] = { phase : Histogram() for phase in self.phases }
+		return phases
+
+	def record ( self, timing ):
+		with self._lock:
+			phases = self._phases( timing )
+			phases['total'].add( timing.dns + timing.connect + timing.ttfb + timing.body )
+			phases['dns'].add( timing.dns )
+			phases['connect'].add( timing.connect )
+			phases['ttfb'].add( timing.ttfb )
+			phases['body'].add( timing.body )
+
+	def recordParse ( self, timing, seconds ):
+		with self._lock:
+			self._phases( timing )['parse'].add( seconds )
+
+	def recordFirstStructure ( self, timing, seconds ):
+		with self._lock:
+			self._phases( timing )['first'].add( seconds )
+
+	def reset ( self ):
+		with self._lock:
+			self._histograms = {}
+			self._cases = []
+
+	def histograms ( self, case = None ):
+		'''Return the phase histograms per `( method, template, status )`, for one case or merged over all.'''
+		merged = {}
+		with self._lock:
+			for ( c, method, template, status ), phases in self._histograms.items():
+				if case is not None and c != case:
+					continue
+				target = merged.setdefault( ( method, template, status ), { phase : Histogram() for phase in self.phases } )
+				for phase, histogram in phases.items():
+					target[phase].merge( histogram )
+		return merged
+
+	def summary ( self ):
+		'''
+		Return the summary lines: p50/p90/p99 per case and request, plus the
+		median of each phase and of the time to the first parsed structure.
+		'''
+		lines = [ 'Request timings in ms (p50/p90/p99; phase medians):' ]
+		for case in self._cases:
+			requests = self.histograms( case )
+			if not requests:
+				continue
+			lines.append( '  ' + str( case ) )
+			for ( method, template, status ), phases in sorted( requests.items(), key=lambda item: str( item[0] ) ):
+				total = phases['total']
+				if not total.count:
+					continue
+				lines.append( '    {0} {1} {2}: n={3} total {4:.1f}/{5:.1f}/{6:.1f}; dns {7:.1f} connect {8:.1f} ttfb {9:.1f} body {10:.1f} parse {11} first structure {12}'.format(
+					method, template, status, total.count,
+					*( 1000 * total.percentile( f ) for f in ( 0.5, 0.9, 0.99 ) ),
+					*( 1000 * phases[phase].percentile( 0.5 ) for phase in ( 'dns', 'connect', 'ttfb', 'body' ) ),
+					*( '{0:.1f}'.format( 1000 * phases[phase].percentile( 0.5 ) ) if phases[phase].count else '-' for phase in ( 'parse', 'first' ) ) ) )
+		return lines
+
+
+class ModuleTimer:
+	'''
+	Measure a single module call: wall and CPU time of the calling thread, and
+	requests and bytes received by the client. With `profile` set to
+	`cprofile`, `tracemalloc` or `all`, also collect the top functions by
+	cumulative time or the peak memory and top allocation sites. Profilers
+	are process-wide, so profiled module calls wait for each other and run
+	one at a time; the wait is not part of the measured times. Memory
+	figures include allocations of concurrently running unprofiled work,
+	and a module call nested in a profiled one is covered by its profile.
+	'''
+	profileLock = threading.Lock()
+	profileLines = 12
+	_profiling = threading.local()
+
+	def __init__ ( self, name, client = None, profile = None ):
+		self.name = name
+		self.client = client
+		self.profile = profile
+		self.record = { 'module' : name, 'wallTime' : 0.0, 'cpuTime' : 0.0, 'requests' : 0, 'wireBytes' : 0, 'bodyBytes' : 0 }
+		self._profiler = None
+
+	def _clientStats ( self ):
+		stats = self.client.poolStats() if self.client is not None and hasattr( self.client, 'poolStats' ) else {}
+		return stats.get( 'hits', 0 ) + stats.get( 'misses', 0 ), stats.get( 'wireBytes', 0 ), stats.get( 'bodyBytes', 0 )
+
+	def __enter__ ( self ):
+		self._owner = self.profile and not getattr( self._profiling, 'active', False )
+		if self._owner:
+			self.profileLock.acquire()
+			self._profiling.active = True
+			if self.profile in ( 'cprofile', 'all' ):
+				import cProfile
+				self._profiler = cProfile.Profile()
+			if self.profile in ( 'tracemalloc', 'all' ):
+				import tracemalloc
+				self._startedTracing = not tracemalloc.is_tracing()
+				if self._startedTracing:
+					tracemalloc.start()
+				if hasattr( tracemalloc, 'reset_peak' ):
+					tracemalloc.reset_peak()
+				self._snapshot = tracemalloc.take_snapshot()
+				self._traced = tracemalloc.get_traced_memory()[0]
+
+		self._stats = self._clientStats()
+		self._start = time.perf_counter()
+		self._cpuStart = time.thread_time() if hasattr( time, 'thread_time' ) else time.process_time()
+		if self._profiler is not None:
+			self._profiler.enable()
+		return self
+
+	def __exit__ ( self, *exc ):
+		if self._profiler is not None:
+			self._profiler.disable()
+		self.record['cpuTime'] = ( time.thread_time() if hasattr( time, 'thread_time' ) else time.process_time() ) - self._cpuStart
+		self.record['wallTime'] = time.perf_counter() - self._start
+		for key, before, after in zip( ( 'requests', 'wireBytes', 'bodyBytes' ), self._stats, self._clientStats() ):
+			self.record[key] = after - before
+
+		if self._owner:
+			try:
+				if self._profiler is not None:
+					import pstats
+					stream = io.StringIO()
+					pstats.Stats( self._profiler, stream=stream ).sort_stats( 'cumulative' ).print_stats( self.profileLines )
+					self.record['profile'] = [ line for line in stream.getvalue().splitlines() if line.strip() ]
+				if self.profile in ( 'tracemalloc', 'all' ):
+					import tracemalloc
+					current, peak = tracemalloc.get_traced_memory()
+					self.record['memoryPeak'] = peak - self._traced
+					self.record['memoryRetained'] = current - self._traced
+					stats = tracemalloc.take_snapshot().compare_to( self._snapshot, 'lineno' )
+					self.record['allocations'] = [ str( stat ) for stat in stats[:5] ]
+					if self._startedTracing:
+						tracemalloc.stop()
+			finally:
+				self._profiling.active = False
+				self.profileLock.release()
+		return False
+
+
+class ModuleStats:
+	'''Running per-module totals of `ModuleTimer` records, for the table of the slowest modules.'''
+
+	def __init__ ( self ):
+		self.modules = {}
+
+	def add ( self, record ):
+		total = self.modules.get( record['module'] )
+		if total is None:
+			total = self.modules[record['module']] = { 'calls' : 0, 'wallTime' : 0.0, 'cpuTime' : 0.0, 'requests' : 0, 'wireBytes' : 0, 'memoryPeak' : None }
+		total['calls'] += 1
+		for key in ( 'wallTime', 'cpuTime', 'requests', 'wireBytes' ):
+			total[key] += record[key]
+		if 'memoryPeak' in record:
+			total['memoryPeak'] = max( total['memoryPeak'] or 0, record['memoryPeak'] )
+
+	def lines ( self, count = 10 ):
+		'''Return summary table lines of the modules with the highest total wall time.'''
+		if not self.modules:
+			return []
+
+		lines = [ 'Slowest modules:', '  {0:<40} {1:>5} {2:>10} {3:>10} {4:>10} {5:>8} {6:>10} {7:>10}'.format(
+			'module', 'calls', 'wall ms', 'mean ms', 'cpu ms', 'requests', 'bytes', 'peak mem' ) ]
+		for name, total in sorted( self.modules.items(), key=lambda item: -item[1]['wallTime'] )[:count]:
+			lines.append( '  {0:<40} {1:>5} {2:>10.1f} {3:>10.1f} {4:>10.1f} {5:>8} {6:>10} {7:>10}'.format(
+				name, total['calls'], 1000 * total['wallTime'], 1000 * total['wallTime'] / total['calls'], 1000 * total['cpuTime'],
+				total['requests'], total['wireBytes'], '-' if total['memoryPeak'] is None else total['memoryPeak'] ) )
+		return lines
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+'''
+OCCI tent mock OCCI server.
+'''
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+import random, threading, time, uuid
+
+from .occi import *
+
+__all__ = [ 'MockOCCIProvider', 'MockOCCIServer' ]
+
+_core = 'http://schemas.ogf.org/occi/core#'
+_infrastructure = 'http://schemas.ogf.org/occi/infrastructure#'
+_actions = 'http://schemas.ogf.org/occi/infrastructure/{0}/action#'
+_synthetic = 'http://example.com/occi-tent/mock#'
+
+def _category ( cls, term, scheme, title = None, location = None, attributes = (), actions = (), rel = None ):
+	category = cls( term, scheme )
+	category.title = title
+	category.location = location
+	category.rel = rel
+	for name in attributes:
+		category.addAttribute( name )
+	category.actions = list( actions )
+	return category
+
+def builtinCategories ():
+	'''Return the categories of OCCI core and infrastructure.'''
+	categories = [
+		_category( KindStructure, 'entity', _core, 'Entity', attributes=( 'occi.core.id', 'occi.core.title' ) ),
+		_category( KindStructure, 'resource', _core, 'Resource', rel=_core + 'entity', attributes=( 'occi.core.summary', ) ),
+		_category( KindStructure, 'link', _core, 'Link', rel=_core + 'entity', attributes=( 'occi.core.source', 'occi.core.target' ) ) ]
+
+	kinds = (
+		( 'compute', 'resource', ( 'occi.compute.architecture', 'occi.compute.cores', 'occi.compute.hostname', 'occi.compute.memory', 'occi.compute.state' ), ( 'restart', 'start', 'stop', 'suspend' ) ),
+		( 'network', 'resource', ( 'occi.network.vlan', 'occi.network.label', 'occi.network.state' ), ( 'down', 'up' ) ),
+		( 'storage', 'resource', ( 'occi.storage.size', 'occi.storage.state' ), ( 'backup', 'offline', 'online', 'resize', 'snapshot' ) ),
+		( 'networkinterface', 'link', ( 'occi.networkinterface.interface', 'occi.networkinterface.mac', 'occi.networkinterface.state' ), ( 'down', 'up' ) ),
+		( 'storagelink', 'link', ( 'occi.storagelink.deviceid', 'occi.storagelink.mountpoint', 'occi.storagelink.state' ), ( 'down', 'up' ) ) )
+	for term, rel, attributes, actions in kinds:
+		categories.append( _category( KindStructure, term, _infrastructure, term.capitalize(), '/{0}/'.format( term ), attributes,
+			( _actions.format( term ) + action for action in actions ), _core + rel ) )
+		categories.extend( _category( ActionStructure, action, _actions.format( term ) ) for action in actions )
+
+	categories.append( _category( MixinStructure, 'ipnetwork', 'http://schemas.ogf.org/occi/infrastructure/network#', 'IP Network Mixin',
+		'/mixins/ipnetwork/', ( 'occi.network.address', 'occi.network.gateway', 'occi.network.allocation' ) ) )
+	return categories
+
+
+class MockOCCIProvider:
+	'''
+	In-memory OCCI provider: query interface with filtering, user-defined
+	mixins, and resource instances under the locations of the `compute` and
+	`storage` kinds, rendered as `text/plain`, `text/occi` or `text/uri-list`.
+
+	Knobs:
+	 - `latency` and `jitter`: seconds added to every response, the jitter
+	   uniformly distributed;
+	 - `errorRate`: fraction of requests answered with `errorStatus`;
+	 - `categories`: number of synthetic kinds with `categoryAttributes`
+	   attributes each, added to the built-in categories;
+	 - `collectionSize`: number of instances initially in each collection;
+	 - `providerMixinStatus`: status for adding or removing provider-defined
+	   or existing mixins, `missingMixinStatus` for removing unknown ones;
+	 - `locationOnCreate`: whether created instances are announced with an
+	   `X-OCCI-Location`, `createStatus` the status of a successful creation;
+	 - `rendering`: rendering preferred when a client accepts several.
+	'''
+	collections = ( 'compute', 'storage' )
+
+	def __init__ ( self, latency = 0.0, jitter = 0.0, errorRate = 0.0, errorStatus = 500, categories = 0, categoryAttributes = 4,
+			collectionSize = 0, providerMixinStatus = 403, missingMixinStatus = 403, locationOnCreate = True, createStatus = 200,
+			rendering = 'text/plain', seed = None ):
+		self.latency = latency
+		self.jitter = jitter
+		self.errorRate = errorRate
+		self.errorStatus = errorStatus
+		self.providerMixinStatus = providerMixinStatus
+		self.missingMixinStatus = missingMixinStatus
+		self.locationOnCreate = locationOnCreate
+		self.createStatus = createStatus
+		self.rendering = rendering
+		self.random = random.Random( seed )
+		self._lock = threading.Lock()
+
+		self.categories = CategoryIndex( builtinCategories() )
+		for i in range( categories ):
+			self.categories.add( _category( KindStructure, 'synthetic{0}'.format( i ), _synthetic, 'Synthetic kind {0}'.format( i ),
+				'/synthetic{0}/'.format( i ), ( 'mock.synthetic{0}.attribute{1}'.format( i, j ) for j in range( categoryAttributes ) ), rel=_core + 'resource' ) )
+		self.providerMixins = frozenset( ( mixin.scheme, mixin.term ) for mixin in self.categories.mixins )
+
+		self.instances = {}
+		for term in self.collections:
+			kind = self.categories.get( _infrastructure, term )
+			for i in range( collectionSize ):
+				self._create( kind, AttributeStructure( { 'occi.core.title' : '"{0} {1}"'.format( term, i ) } ), [] )
+
+	@classmethod
+	def fromConfig ( cls, config ):
+		'''Create a provider from a configuration mapping; unknown keys are ignored.'''
+		keys = ( 'latency', 'jitter', 'errorRate', 'errorStatus', 'categories', 'categoryAttributes', 'collectionSize',
+			'providerMixinStatus', 'missingMixinStatus', 'locationOnCreate', 'createStatus', 'rendering', 'seed' )
+		return cls( **{ key : config[key] for key in keys if key in config } )
+
+	def _create ( self, kind, attributes, mixins ):
+		path = '{0}{1}'.format( kind.location, uuid.UUID( int=self.random.getrandbits( 128 ) ) )
+		attributes = AttributeStructure( attributes )
+		attributes['occi.core.id'] = '"{0}"'.format( path.rsplit( '/', 1 )[1] )
+		self.instances[path] = ( kind, attributes, mixins )
+		return path
+
+	def delay ( self ):
+		'''Sleep for the configured latency plus jitter.'''
+		seconds = self.latency + ( self.random.uniform( 0, self.jitter ) if self.jitter else 0 )
+		if seconds > 0:
+			time.sleep( seconds )
+
+	def handle ( self, method, path, headers, body ):
+		'''Handle a request and return the status, the structures or URIs of the response, and whether they are URIs.'''
+		self.delay()
+		if self.errorRate and self.random.random() < self.errorRate:
+			return self.errorStatus, [], False
+
+		structures = parseHeaders( headers.items() )
+		if body and ( headers.get( 'Content-Type' ) or 'text/plain' ).startswith( 'text/plain' ):
+			structures.extend( parseText( body.decode( 'utf-8', 'replace' ) ) )
+		path = path.split( '?', 1 )[0]
+
+		with self._lock:
+			if path == '/-/':
+				handler = getattr( self, 'query' + method.capitalize(), None )
+				if handler is None:
+					return 405, [], False
+				return handler( structures )
+
+			collection = path.rsplit( '/', 1 )[0] + '/'
+			kind = self.categories.byLocation( path ) or self.categories.byLocation( collection )
+			if kind is None or kind.term not in self.collections or kind.scheme != _infrastructure:
+				return 404, [], False
+			if path == kind.location:
+				return self.collection( method, kind, structures )
+			return self.instance( method, path, structures )
+
+	def queryGet ( self, structures ):
+		categories = [ s for s in structures if isinstance( s, CategoryStructure ) ]
+		if not categories:
+			return 200, list( self.categories ), False
+		filtered = CategoryIndex( categories )
+		return 200, [ category for category in self.categories if category in filtered ], False
+
+	def queryPost ( self, structures ):
+		mixins = [ s for s in structures if isinstance( s, CategoryStructure ) ]
+		if not mixins or not all( mixin.isMixin() for mixin in mixins ):
+			return 400, [], False
+		if any( mixin in self.categories for mixin in mixins ):
+			return self.providerMixinStatus, [], False
+		for mixin in mixins:
+			mixin = mixin.copy()
+			mixin.location = mixin.location or '/mixins/{0}/'.format( mixin.term )
+			self.categories.add( mixin )
+		return 200, [], False
+
+	def queryDelete ( self, structures ):
+		mixins = [ s for s in structures if isinstance( s, CategoryStructure ) ]
+		if not mixins or not all( mixin.isMixin() for mixin in mixins ):
+			return 400, [], False
+		for mixin in mixins:
+			if ( mixin.scheme, mixin.term ) in self.providerMixins:
+				return self.providerMixinStatus, [], False
+			if mixin not in self.categories:
+				return self.missingMixinStatus, [], False
+		for mixin in mixins:
+			self.categories.discard( mixin )
+		return 200, [], False
+
+	def collection ( self, method, kind, structures ):
+		paths = [ path for path in self.instances if path.startswith( kind.location ) ]
+		if method == 'GET':
+			return 200, paths, True
+		if method == 'DELETE':
+			for path in paths:
+				del self.instances[path]
+			return 200, [], False
+		if method == 'POST':
+			categories = [ s for s in structures if isinstance( s, CategoryStructure ) ]
+			if any( category.isKind() and category != kind for category in categories ):
+				return 400, [], False
+			attributes = AttributeStructure()
+			for structure in structures:
+				if isinstance( structure, AttributeStructure ):
+					attributes.update( structure )
+			path = self._create( kind, attributes, [ category for category in categories if category.isMixin() ] )
+			return self.createStatus, [ LocationStructure( ( path, ) ) ] if self.locationOnCreate else [], False
+		return 405, [], False
+
+	def instance ( self, method, path, structures ):
+		if path not in self.instances:
+			return 404, [], False
+		if method == 'GET':
+			kind, attributes, mixins = self.instances[path]
+			return 200, [ kind.identity() ] + [ mixin.identity() for mixin in mixins ] + [ attributes ], False
+		if method == 'DELETE':
+			del self.instances[path]
+			return 200, [], False
+		if method in ( 'POST', 'PUT' ):
+			kind, attributes, mixins = self.instances[path]
+			for structure in structures:
+				if isinstance( structure, AttributeStructure ):
+					attributes.update( structure )
+			return 200, [], False
+		return 405, [], False
+
+
+class MockOCCIRequestHandler ( BaseHTTPRequestHandler ):
+	server_version = 'TentMock/1.0'
+	protocol_version = 'HTTP/1.1'
+	disable_nagle_algorithm = True
+
+	joinedHeaders = frozenset( ( 'Category', 'Link', 'X-OCCI-Location' ) )
+	maxFieldSize = 16384
+
+	def log_message ( self, format, *args ):
+		pass
+
+	def headerFields ( self, structures ):
+		'''
+		Return the `text/occi` header fields of the structures. Values of the
+		list headers are joined into fields of up to `maxFieldSize` bytes, as
+		`http.client` refuses more than 100 fields or lines over 64 KiB.
+		'''
+		fields, joined = [], {}
+		for structure in structures:
+			value = repr( structure )
+			if not value:
+				continue
+			name = structure.headerName
+			if name not in self.joinedHeaders:
+				fields.append( [ name, value ] )
+			elif name in joined and len( joined[name][1] ) + len( value ) < self.maxFieldSize:
+				joined[name][1] += ', ' + value
+			else:
+				joined[name] = [ name, value ]
+				fields.append( joined[name] )
+		return [ tuple( field ) for field in fields ]
+
+	def handleRequest ( self ):
+		length = int( self.headers.get( 'Content-Length' ) or 0 )
+		body = self.rfile.read( length ) if length else b''
+		provider = self.server.provider
+		status, result, uris = provider.handle( self.command, self.path, self.headers, body )
+
+		accept = self.headers.get( 'Accept' ) or '*/*'
+		if uris and 'text/uri-list' in accept:
+			# separated the way `OCCIResponse.uris` splits them
+			contentType, headers, payload = 'text/uri-list', [], '\n\r'.join( result )
+		else:
+			if uris:
+				result = [ LocationStructure( ( path, ) ) for path in result ]
+			accepted = [ t for t in ( provider.rendering, 'text/plain', 'text/occi' ) if t in accept ]
+			contentType = accepted[0] if accepted else 'text/plain'
+			if contentType == 'text/occi':
+				headers = self.headerFields( result )
+				payload = 'OK' if 200 <= status < 300 else self.responses.get( status, ( '', ) )[0]
+			else:
+				headers = []
+				payload = '\n'.join( str( structure ) for structure in result ) if result else ( 'OK' if 200 <= status < 300 else self.responses.get( status, ( '', ) )[0] )
+
+		# send status line, headers and body in a single write
+		payload = ( payload if contentType == 'text/uri-list' else payload + '\n' ).encode()
+		lines = [ 'HTTP/1.1 {0} {1}'.format( status, self.responses.get( status, ( '', ) )[0] ),
+			'Server: ' + self.version_string(), 'Date: ' + self.date_time_string(),
+			'Content-Type: ' + contentType, 'Content-Length: {0}'.format( len( payload ) ) ]
+		lines.extend( '{0}: {1}'.format( name, value ) for name, value in headers )
+		self.wfile.write( ( '\r\n'.join( lines ) + '\r\n\r\n' ).encode() + payload )
+
+	do_GET = do_POST = do_PUT = do_DELETE = handleRequest
+
+
+class MockOCCIServer ( ThreadingMixIn, HTTPServer ):
+	'''
+	Threaded HTTP server serving a `MockOCCIProvider`. `start` serves requests
+	on a daemon thread; the bound address is available as `address`.
+	'''
+	daemon_threads = True
+
+	def __init__ ( self, provider = None, host = '127.0.0.1', port = 0 ):
+		super().__init__( ( host, port ), MockOCCIRequestHandler )
+		self.provider = provider or MockOCCIProvider()
+		self._thread = None
+
+	@classmethod
+	def fromConfig ( cls, config ):
+		'''Create a server from a configuration mapping with provider knobs and optional `host` and `port`.'''
+		return cls( MockOCCIProvider.fromConfig( config ), config.get( 'host', '127.0.0.1' ), config.get( 'port', 0 ) )
+
+	@property
+	def address ( self ):
+		return self.server_address[:2]
+
+	def start ( self ):
+		self._thread = threading.Thread( name='MockOCCIServer', target=self.serve_forever, daemon=True )
+		self._thread.start()
+		return self
+
+	def stop ( self ):
+		self.shutdown()
+		self.server_close()
+
+
+if __name__ == '__main__':
+	import argparse
+	parser = argparse.ArgumentParser( description='OCCI tent mock OCCI server', epilog=None )
+	parser.add_argument( '--port', '-p', default=3000, type=int, help='port on which the server should listen (default: %(default)s)' )
+	parser.add_argument( '--latency', default=0.0, type=float, help='response latency in seconds (default: %(default)s)' )
+	parser.add_argument( '--jitter', default=0.0, type=float, help='additional random latency in seconds (default: %(default)s)' )
+	parser.add_argument( '--error-rate', default=0.0, type=float, help='fraction of failing requests (default: %(default)s)' )
+	parser.add_argument( '--categories', default=0, type=int, help='number of synthetic kinds (default: %(default)s)' )
+	parser.add_argument( '--collection-size', default=0, type=int, help='initial instances per collection (default: %(default)s)' )
+	args = parser.parse_args()
+
+	provider = MockOCCIProvider( latency=args.latency, jitter=args.jitter, errorRate=args.error_rate,
+		categories=args.categories, collectionSize=args.collection_size )
+	server = MockOCCIServer( provider, '', args.port )
+	print( 'Serving mock OCCI provider on {0}:{1}...'.format( *server.address ) )
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		server.server_close()
@@ -6,13 +6,24 @@ OCCI rendering structures.
 from urllib.request import urlopen
 from urllib.error import URLError, HTTPError
 import urllib.parse, urllib.request
-import re
+import re, sys
 
 __all__ = [
 		'OCCIStructure',
 		'AttributeStructure', 'LocationStructure',
 		'CategoryStructure', 'MixinStructure', 'KindStructure', 'ActionStructure',
-		'LinkStructure' ]
+		'LinkStructure', 'CategoryIndex',
+		'parseStructure', 'parseText', 'parseHeaders' ]
+
+# Tokenizer patterns for the OCCI text rendering. Quoted strings may contain
+# any character but a quote, including `;`, `,` and `=`.
+_listItemPattern = re.compile( r'(?:[^,"]|"[^"]*")+' )
+_attributePattern = re.compile( r'([^\s{]+)(?:\{([^}]*)\})?' )
+_validProperties = frozenset( ( 'immutable', 'required' ) )
+
+# Attribute property sets are immutable and shared between all attributes.
+_propertySets = { props : props for props in map( frozenset, ( (), ( 'immutable', ), ( 'required', ), ( 'immutable', 'required' ) ) ) }
+_intern = sys.intern
 
 def stripQuotes ( text, quotesRequired = False ):
 	'''Strips leading and trailing quotes from the given string.'''
@@ -24,6 +35,7 @@ def stripQuotes ( text, quotesRequired = False ):
 
 
 class OCCIStructure:
+	__slots__ = ()
 	headerName = ''
 
 	def __str__ ( self ):
@@ -31,64 +43,88 @@ class OCCIStructure:
 	
 	@classmethod
 	def parse ( cls, line, strict = False ):
-		raise NotImplemented()
+		'''Parse the structure from a rendering line, with or without header name.'''
+		if line.startswith( cls.headerName + ':' ):
+			line = line[len( cls.headerName ) + 1:]
+		return cls.parseValue( line, strict=strict )
+	
+	@classmethod
+	def parseValue ( cls, value, strict = False ):
+		'''Parse the structure from a header value.'''
+		raise NotImplementedError()
 	
 	def __ne__ ( self, other ):
 		return not self.__eq__( other )
+	
+	def copy ( self ):
+		'''Return a copy that can be modified without affecting this structure.'''
+		raise NotImplementedError()
 
 
 class AttributeStructure ( OCCIStructure, dict ):
+	__slots__ = ()
 	headerName = 'X-OCCI-Attribute'
 
 	def __repr__ ( self ):
 		return ', '.join( key + '=' + value for key, value in self.items() )
+	
+	def copy ( self ):
+		return type( self )( self )
 
 	@classmethod
-	def parse ( cls, line, strict = False ):
-		if line.startswith( cls.headerName ):
-			line = line[len( cls.headerName ) + 1:]
-		
+	def parseValue ( cls, value, strict = False ):
 		self = cls.__new__ ( cls )
-		for attribute in line.split( ',' ):
-			if key.split() == '':
+		for attribute in _listItemPattern.findall( value ):
+			key, sep, value = attribute.partition( '=' )
+			key = key.strip()
+			if not key:
 				continue
-			
-			key, value = attribute.split( '=' )
-			self[ key.strip() ] = value.strip()
+			if not sep:
+				raise ValueError( 'Invalid attribute structure: `{0}` has no value.'.format( key ) )
+			self[_intern( key )] = value.strip()
 		
 		return self
 
 
 class LocationStructure ( OCCIStructure, list ):
+	__slots__ = ()
 	headerName = 'X-OCCI-Location'
 
 	def __repr__ ( self ):
 		return ', '.join( self )
 	
+	def copy ( self ):
+		return type( self )( self )
+	
 	@classmethod
 	def parse ( cls, line, strict = False ):
-		if line.startswith( cls.headerName ):
-			line = line[len( cls.headerName ) + 1:]
-		elif line.startswith( 'Location:' ):
+		if line.startswith( 'Location:' ):
 			line = line[9:]
-		
+		return super().parse( line, strict=strict )
+	
+	@classmethod
+	def parseValue ( cls, value, strict = False ):
 		self = cls.__new__ ( cls )
-		for location in line.split( ',' ):
-			if location.split() == '':
-				continue
-			
-			self.append( location.strip() )
+		for location in value.split( ',' ):
+			location = location.strip()
+			if location:
+				self.append( location )
 		
 		return self
 
 
 class CategoryStructure ( OCCIStructure ):
+	'''
+	Category rendering. Terms, schemes and attribute names are interned, and
+	attribute properties are shared frozen sets.
+	'''
+	__slots__ = ( 'term', 'scheme', 'title', 'rel', 'location', 'attributes', 'actions' )
 	headerName = 'Category'
 	categoryClass = None
 
 	def __init__ ( self, term, scheme ):
-		self.term = term
-		self.scheme = scheme
+		self.term = _intern( term )
+		self.scheme = _intern( scheme )
 		self.title = None
 		self.rel = None
 		self.location = None
@@ -101,7 +137,7 @@ class CategoryStructure ( OCCIStructure ):
 			properties.add( 'immutable' )
 		if required:
 			properties.add( 'required' )
-		self.attributes.append( ( name, properties ) )
+		self.attributes.append( ( _intern( name ), _propertySets[frozenset( properties )] ) )
 	
 	def __repr__ ( self ):
 		l = [ self.term, 'scheme="' + self.scheme + '"', 'class="' + self.categoryClass + '"' ]
@@ -128,72 +164,49 @@ class CategoryStructure ( OCCIStructure ):
 		return '; '.join( l );
 	
 	def __eq__ ( self, other ):
-		return other and self.categoryClass == other.categoryClass and self.term == other.term and self.scheme == self.scheme
+		return other and self.categoryClass == other.categoryClass and self.term == other.term and self.scheme == other.scheme
 	
 	def __hash__ ( self ):
 		return hash( ( self.categoryClass, self.term, self.scheme ) )
 	
 	@classmethod
-	def parse ( cls, line, strict = False ):
-		if line.startswith( cls.headerName ):
-			line = line[len( cls.headerName ) + 1:]
-		
-		term, *parts = line.split( ';' )
-		parts = dict( list( part.split( '=' ) for part in map( lambda x: x.strip(), parts ) if part ) )
+	def parseValue ( cls, value, strict = False ):
+		term, sep, value = value.partition( ';' )
+		params = _parseParameters( value, strict, 'category' )
 
 		try:
-			parts['class'] = stripQuotes( parts['class'] )
-			if parts['class'] == 'mixin':
-				self = MixinStructure.__new__( MixinStructure )
-			elif parts['class'] == 'kind':
-				self = KindStructure.__new__( KindStructure )
-			elif parts['class'] == 'action':
-				self = ActionStructure.__new__( ActionStructure )
-			else:
-				self = cls.__new__( cls )
-			
-			self.term = term.strip()
-			self.scheme = stripQuotes( parts['scheme'], quotesRequired=strict )
-			del parts['class'], parts['scheme']
+			categoryClass = _categoryClasses.get( params.pop( 'class' ), cls )
+			self = categoryClass.__new__( categoryClass )
+			self.term = _intern( term.strip() )
+			self.scheme = _intern( params.pop( 'scheme' ) )
 		except KeyError as e:
 			raise TypeError( 'Invalid category structure: `{0}` key is missing.'.format( *e.args ) )
 		
-		self.title = None
-		self.rel = None
-		self.location = None
-		self.attributes = []
-		self.actions = []
-
-		if 'title' in parts:
-			self.title = stripQuotes( parts['title'], quotesRequired=strict )
-			del parts['title']
-		
-		if 'rel' in parts:
-			self.rel = stripQuotes( parts['rel'], quotesRequired=strict )
-			del parts['rel']
-		
-		if 'location' in parts:
-			self.location = stripQuotes( parts['location'], quotesRequired=strict )
-			del parts['location']
+		self.title = params.pop( 'title', None )
+		rel = params.pop( 'rel', None )
+		self.rel = _intern( rel ) if rel else rel
+		self.location = params.pop( 'location', None )
 		
-		if 'attributes' in parts:
-			validProperties = set( ( 'immutable', 'required' ) )
-			# TODO: Replace re.find with re.split to not skip invalid parts of the string.
-			for name, properties in re.findall( '(?:([^ {]+)(?:{([^}]+)})?)', stripQuotes( parts['attributes'], quotesRequired=strict ) ):
-				props = set( properties.split() )
-				if strict and len( props - validProperties ) > 0:
-					raise ValueError( 'Invalid category structure: Unknown attribute properties found (`{0}`).'.format( '`, `'.join( props - validProperties ) ) )
-				self.attributes.append( ( name.strip(), props & validProperties ) )
-			del parts['attributes']
+		attributes = params.pop( 'attributes', None )
+		self.attributes = list( _parseAttributes( attributes, strict ) ) if attributes else []
 		
-		if 'actions' in parts:
-			self.actions = stripQuotes( parts['actions'], quotesRequired=strict ).split()
-			del parts['actions']
+		actions = params.pop( 'actions', None )
+		self.actions = list( map( _intern, actions.split() ) ) if actions else []
 		
-		if strict and len( parts ) > 0:
-			raise ValueError( 'Invalid category structure: Unknown keys found (`{0}`).'.format( '`, `'.join( parts.keys() ) ) )
-		else:
-			return self
+		if strict and params:
+			raise ValueError( 'Invalid category structure: Unknown keys found (`{0}`).'.format( '`, `'.join( params.keys() ) ) )
+		return self
+	
+	def copy ( self ):
+		clone = object.__new__( type( self ) )
+		clone.term = self.term
+		clone.scheme = self.scheme
+		clone.title = self.title
+		clone.rel = self.rel
+		clone.location = self.location
+		clone.attributes = self.attributes[:]
+		clone.actions = self.actions[:]
+		return clone
 	
 	def identity ( self ):
 		'''Clone the object, and remove all properties not relevant for the identity.'''
@@ -212,26 +225,30 @@ class CategoryStructure ( OCCIStructure ):
 
 
 class MixinStructure ( CategoryStructure ):
+	__slots__ = ()
 	categoryClass = 'mixin'
 
 
 class KindStructure ( CategoryStructure ):
+	__slots__ = ()
 	categoryClass = 'kind'
 
 
 class ActionStructure ( CategoryStructure ):
+	__slots__ = ()
 	categoryClass = 'action'
 
 
 class LinkStructure ( OCCIStructure ):
+	__slots__ = ( 'link', 'rel', 'selfLink', 'category', 'attributes', 'actions' )
 	headerName = 'Link'
 
 	def __init__ ( self, link, rel ):
 		self.link = link
-		self.rel = rel
+		self.rel = _intern( rel )
 		self.selfLink = None
 		self.category = None
-		self.attributes = []
+		self.attributes = {}
 		self.actions = []
 
 	def __repr__ ( self ):
@@ -252,39 +269,265 @@ class LinkStructure ( OCCIStructure ):
 	
 	def __hash__ ( self ):
 		return hash( ( self.link, self.rel ) )
+	
+	def copy ( self ):
+		clone = object.__new__( type( self ) )
+		clone.link = self.link
+		clone.rel = self.rel
+		clone.selfLink = self.selfLink
+		clone.category = self.category
+		clone.attributes = self.attributes.copy()
+		clone.actions = self.actions[:]
+		return clone
 
 	@classmethod
-	def parse ( cls, line, strict = False ):
-		if line.startswith( cls.headerName ):
-			line = line[len( cls.headerName ) + 1:]
-		
-		parts = line.split( ';' )
-		link = parts.pop( 0 ).strip()[1:-1]
-		parts = dict( map( lambda x: x.strip(), part.split( '=' ) ) for part in parts )
+	def parseValue ( cls, value, strict = False ):
+		link, sep, value = value.partition( ';' )
+		link = link.strip()
+		if link[:1] != '<' or link[-1:] != '>':
+			raise TypeError( 'Invalid link structure: Link target is missing.' )
+		params = _parseParameters( value, strict, 'link' )
 
 		try:
 			self = cls.__new__( cls )
-			self.link = link
-			self.rel = stripQuotes( parts['rel'], quotesRequired=strict )
-			del parts['rel']
+			self.link = link[1:-1]
+			self.rel = _intern( params.pop( 'rel' ) )
 		except KeyError as e:
 			raise TypeError( 'Invalid link structure: `{0}` key is missing.'.format( *e.args ) )
 		
-		self.selfLink = None
-		self.category = None
-		self.attributes = []
+		self.selfLink = params.pop( 'self', None )
+		category = params.pop( 'category', None )
+		self.category = _intern( category ) if category else category
+		self.attributes = params
 		self.actions = []
+		return self
+
+
+_categoryClasses = {
+	MixinStructure.categoryClass : MixinStructure,
+	KindStructure.categoryClass : KindStructure,
+	ActionStructure.categoryClass : ActionStructure }
+
+_headerClasses = {
+	CategoryStructure.headerName : CategoryStructure,
+	LinkStructure.headerName : LinkStructure,
+	LocationStructure.headerName : LocationStructure,
+	'Location' : LocationStructure,
+	AttributeStructure.headerName : AttributeStructure }
+
+# header fields rendering one structure per comma-separated list item
+_compositeHeaders = ( CategoryStructure, LinkStructure )
+
+_attributeCache = {}
+
+def _parseAttributes ( attributes, strict ):
+	'''
+	Parse an attribute list into `( name, properties )` pairs. Query interfaces
+	repeat the same attribute lists for many categories, so results for recent
+	lists are memoized.
+	'''
+	try:
+		return _attributeCache[attributes]
+	except KeyError:
+		pass
+	
+	parsed = []
+	valid = True
+	for name, properties in _attributePattern.findall( attributes ):
+		props = frozenset( properties.split() )
+		if not props <= _validProperties:
+			if strict:
+				raise ValueError( 'Invalid category structure: Unknown attribute properties found (`{0}`).'.format( '`, `'.join( props - _validProperties ) ) )
+			props &= _validProperties
+			valid = False
+		parsed.append( ( _intern( name ), _propertySets[props] ) )
+	
+	# only cache lists that also pass strict parsing
+	if valid:
+		if len( _attributeCache ) >= 1024:
+			_attributeCache.clear()
+		_attributeCache[attributes] = parsed
+	return parsed
+
+def _parseParameters ( value, strict, structureName ):
+	'''
+	Tokenize the `key=value` parameters following the first `;` in a single
+	pass. The value is split at quotes once; plain text then only occurs at
+	even positions. Renderings where every value is quoted and every plain
+	chunk is a single `; key=` are mapped directly, all others are scanned
+	chunk by chunk.
+	'''
+	chunks = value.split( '"' )
+	if not len( chunks ) & 1:
+		raise ValueError( 'Invalid {0} structure: Unbalanced quotes.'.format( structureName ) )
+	
+	plain = chunks[0::2]
+	quoted = chunks[1::2]
+	tail = plain.pop()
+	joined = ''.join( plain )
+	if not strict and joined.count( '=' ) == len( plain ) and joined.count( ';' ) == len( plain ) - 1 and tail.strip() in ( '', ';' ):
+		keys = joined.replace( ';', ' ' ).replace( '=', ' ' ).split()
+		if len( keys ) == len( quoted ):
+			return dict( zip( keys, quoted ) )
+	
+	plain.append( tail )
+	quoted.append( None )
+	params = {}
+	first = True
+	for text, quotedValue in zip( plain, quoted ):
+		parts = text.split( ';' )
+		if first:
+			first = False
+		elif parts.pop( 0 ).strip():
+			raise ValueError( 'Invalid {0} structure: Malformed parameters (`{1}`).'.format( structureName, text.strip() ) )
 		
-		if 'self' in parts:
-			self.selfLink = stripQuotes( parts['self'], quotesRequired=strict )
-			del parts['self']
-		
-		if 'category' in parts:
-			self.category = stripQuotes( parts['category'], quotesRequred=strict )
-			del parts['category']
+		key = None
+		for part in parts:
+			key, sep, paramValue = part.partition( '=' )
+			key = key.strip()
+			if not sep:
+				if key:
+					raise ValueError( 'Invalid {0} structure: Malformed parameters (`{1}`).'.format( structureName, part.strip() ) )
+				continue
+			paramValue = paramValue.strip()
+			if paramValue and strict and key != 'class':
+				raise ValueError( 'String is required to be enquoted.' )
+			params[key] = paramValue
 		
-		self.attributes = {}
-		for name, value in parts.items():
-			self.attributes[name] = stripQuotes( value )
+		if quotedValue is not None:
+			if key is None or params[key]:
+				raise ValueError( 'Invalid {0} structure: Malformed parameters (`{1}`).'.format( structureName, text.strip() ) )
+			params[key] = quotedValue
+	
+	return params
+
+def parseStructure ( line, strict = False ):
+	'''Parse the structure in the given rendering line.'''
+	name, sep, value = line.partition( ':' )
+	cls = _headerClasses.get( name ) if sep else None
+	if cls:
+		return cls.parseValue( value, strict=strict )
+	elif strict and line != '':
+		raise TypeError( 'Invalid response data' )
+	else:
+		return line
+
+def parseText ( body, strict = False ):
+	'''Parse a complete `text/plain` rendering into a list of structures, skipping blank lines.'''
+	return [ parseStructure( line, strict ) for line in map( str.strip, body.split( '\n' ) ) if line ]
+
+def parseHeaders ( headers, strict = False ):
+	'''
+	Parse the OCCI header fields of a `text/occi` rendering, given as a
+	message object or a sequence of `( name, value )` pairs, into a list of
+	structures. Composite `Category` and `Link` header values are split into
+	one structure per list item.
+	'''
+	structures = []
+	for name, value in ( headers.items() if hasattr( headers, 'items' ) else headers ):
+		cls = _headerClasses.get( '-'.join( part.capitalize() for part in name.split( '-' ) ).replace( 'Occi', 'OCCI' ) )
+		if cls is None:
+			continue
+		if cls in _compositeHeaders:
+			structures.extend( cls.parseValue( item, strict=strict ) for item in _listItemPattern.findall( value ) if item.strip() )
+		else:
+			structures.append( cls.parseValue( value, strict=strict ) )
+	return structures
+
+
+class CategoryIndex:
+	'''
+	Index over the category structures of a response. Categories are looked up
+	by their identity `( scheme, term )`, by category class and by location in
+	constant time; non-category structures are ignored.
+	'''
+
+	def __init__ ( self, structures = () ):
+		self._byKey = {}
+		self._byClass = {}
+		self._byLocation = {}
+		for structure in structures:
+			if isinstance( structure, CategoryStructure ):
+				self.add( structure )
+	
+	@classmethod
+	def fromResponse ( cls, response ):
+		'''Build the index from an `OCCIResponse` in a single pass over its structures.'''
+		return cls( response.iterStructures() )
+	
+	def add ( self, category ):
+		'''Add a category, replacing any category with the same identity.'''
+		key = ( category.scheme, category.term )
+		if key in self._byKey:
+			self.discard( self._byKey[key] )
 		
-		return self
\ No newline at end of file
+		self._byKey[key] = category
+		self._byClass.setdefault( category.categoryClass, {} )[key] = category
+		if category.location:
+			self._byLocation[category.location] = category
+	
+	def discard ( self, category ):
+		'''Remove the category with the identity of the given category if present.'''
+		key = ( category.scheme, category.term )
+		indexed = self._byKey.pop( key, None )
+		if indexed is not None:
+			del self._byClass[indexed.categoryClass][key]
+			if indexed.location and self._byLocation.get( indexed.location ) is indexed:
+				del self._byLocation[indexed.location]
+	
+	def get ( self, scheme, term, default = None ):
+		'''Return the category identified by scheme and term.'''
+		return self._byKey.get( ( scheme, term ), default )
+	
+	def ofClass ( self, categoryClass ):
+		'''Return all categories of the given category class.'''
+		return list( self._byClass.get( categoryClass, {} ).values() )
+	
+	@property
+	def kinds ( self ):
+		return self.ofClass( KindStructure.categoryClass )
+	
+	@property
+	def mixins ( self ):
+		return self.ofClass( MixinStructure.categoryClass )
+	
+	@property
+	def actions ( self ):
+		return self.ofClass( ActionStructure.categoryClass )
+	
+	def byLocation ( self, location, default = None ):
+		'''Return the category bound to the given location.'''
+		return self._byLocation.get( location, default )
+	
+	def __contains__ ( self, category ):
+		if isinstance( category, tuple ):
+			return category in self._byKey
+		indexed = self._byKey.get( ( category.scheme, category.term ) )
+		return indexed is not None and ( category.categoryClass is None or indexed.categoryClass == category.categoryClass )
+	
+	def __iter__ ( self ):
+		return iter( self._byKey.values() )
+	
+	def __len__ ( self ):
+		return len( self._byKey )
+	
+	def __repr__ ( self ):
+		return '<CategoryIndex: {0} kinds, {1} mixins, {2} actions>'.format( *( len( self._byClass.get( c, () ) ) for c in ( 'kind', 'mixin', 'action' ) ) )
+	
+	def missing ( self, categories ):
+		'''Return the given categories that are not in the index, preserving their order.'''
+		return [ category for category in categories if category not in self ]
+	
+	def issuperset ( self, categories ):
+		'''Test whether all given categories are in the index.'''
+		return all( category in self for category in categories )
+	
+	def issubset ( self, categories ):
+		'''Test whether all indexed categories are among the given categories.'''
+		other = categories if isinstance( categories, CategoryIndex ) else CategoryIndex( categories )
+		return other.issuperset( self )
+	
+	def difference ( self, categories ):
+		'''Return the indexed categories that are not among the given categories.'''
+		other = categories if isinstance( categories, CategoryIndex ) else CategoryIndex( categories )
+		return [ category for category in self if category not in other ]
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+'''
+OCCI tent network shaping proxy.
+'''
+
+from contextlib import contextmanager
+from socketserver import BaseRequestHandler, TCPServer, ThreadingMixIn
+import os, queue, random, socket, struct, threading, time
+
+__all__ = [ 'ShapingProxy' ]
+
+class ShapedPipe:
+	'''
+	One direction of a proxied connection. A reader thread stamps every chunk
+	with its delivery time, the arrival plus the current delay and jitter, so
+	the stream as a whole is delayed rather than each chunk; the writer
+	delivers chunks at that time, within the bandwidth cap and, for
+	responses, in slow-drip pieces.
+	'''
+
+	def __init__ ( self, proxy, source, sink, response ):
+		self.proxy = proxy
+		self.source = source
+		self.sink = sink
+		self.response = response
+		self.reset = False
+		self._queue = queue.Queue()
+
+	def read ( self ):
+		due = 0.0
+		try:
+			while True:
+				data = self.source.recv( 65536 )
+				if not data:
+					break
+				if self.response and self.proxy.shouldReset():
+					self.reset = True
+					break
+				due = max( due, time.perf_counter() + self.proxy.oneWayDelay() )
+				self._queue.put( ( due, data ) )
+		except OSError:
+			pass
+		self._queue.put( None )
+
+	def write ( self ):
+		proxy = self.proxy
+		try:
+			while True:
+				item = self._queue.get()
+				if item is None:
+					break
+				due, data = item
+				delay = due - time.perf_counter()
+				if delay > 0:
+					time.sleep( delay )
+
+				drip = proxy.dripBytes if self.response and proxy.dripBytes else None
+				step = drip or ( max( 1024, int( proxy.bandwidth / 50 ) ) if proxy.bandwidth else len( data ) )
+				for offset in range( 0, len( data ), step ):
+					piece = data[offset:offset + step]
+					if proxy.bandwidth:
+						time.sleep( len( piece ) / proxy.bandwidth )
+					if drip and offset:
+						time.sleep( proxy.dripInterval )
+					self.sink.sendall( piece )
+				proxy.count( 'downstream' if self.response else 'upstream', len( data ) )
+
+			if self.reset:
+				proxy.count( 'resets', 1 )
+				# wake the reader of the client socket, then close abortively to send a TCP reset instead of a FIN
+				self.sink.setsockopt( socket.SOL_SOCKET, socket.SO_LINGER, struct.pack( 'ii', 1, 0 ) )
+				self.sink.shutdown( socket.SHUT_RD )
+				self.sink.close()
+				self.source.shutdown( socket.SHUT_RDWR )
+			else:
+				self.sink.shutdown( socket.SHUT_WR )
+		except OSError:
+			for sock in ( self.source, self.sink ):
+				try:
+					sock.shutdown( socket.SHUT_RDWR )
+				except OSError:
+					pass
+
+
+class ShapingHandler ( BaseRequestHandler ):
+	'''Connect to the target and shape the traffic in both directions until both are closed.'''
+
+	def handle ( self ):
+		proxy = self.server
+		try:
+			upstream = socket.create_connection( proxy.target )
+		except OSError:
+			return
+		upstream.setsockopt( socket.IPPROTO_TCP, socket.TCP_NODELAY, 1 )
+		self.request.setsockopt( socket.IPPROTO_TCP, socket.TCP_NODELAY, 1 )
+		proxy.count( 'connections', 1 )
+
+		pipes = ( ShapedPipe( proxy, self.request, upstream, False ), ShapedPipe( proxy, upstream, self.request, True ) )
+		threads = [ threading.Thread( name='ShapingProxy-{0}'.format( part.__name__ ), target=part, daemon=True )
+			for pipe in pipes for part in ( pipe.read, pipe.write ) ]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		upstream.close()
+
+
+class ShapingProxy ( ThreadingMixIn, TCPServer ):
+	'''
+	Local TCP proxy to `target` that makes a fast link behave like a slow or
+	unreliable one. Knobs:
+	 - `delay` and `jitter`: seconds each direction of the stream is delayed
+	   by, the jitter uniformly distributed, so a round trip adds twice that;
+	 - `bandwidth`: bytes per second per connection and direction, or None;
+	 - `dripBytes` and `dripInterval`: deliver responses in pieces of this
+	   size with this pause in between, or all at once if `dripBytes` is None;
+	 - `resetRate`: fraction of chunks received from the target answered with
+	   a connection reset to the client instead.
+
+	Knobs can be changed while connections are open with `configure`;
+	`suites` maps suite file names to knob overrides applied by `suite`.
+	'''
+	daemon_threads = True
+	allow_reuse_address = True
+	knobs = ( 'delay', 'jitter', 'bandwidth', 'dripBytes', 'dripInterval', 'resetRate' )
+
+	def __init__ ( self, targetHost, targetPort, host = '127.0.0.1', port = 0, delay = 0.0, jitter = 0.0, bandwidth = None,
+			dripBytes = None, dripInterval = 0.0, resetRate = 0.0, suites = None, seed = None ):
+		super().__init__( ( host, port ), ShapingHandler )
+		self.target = ( targetHost, int( targetPort ) )
+		self.defaults = { 'delay' : delay, 'jitter' : jitter, 'bandwidth' : bandwidth,
+			'dripBytes' : dripBytes, 'dripInterval' : dripInterval, 'resetRate' : resetRate }
+		self.suites = suites or {}
+		self.random = random.Random( seed )
+		self.stats = { 'connections' : 0, 'resets' : 0, 'upstream' : 0, 'downstream' : 0 }
+		self._lock = threading.Lock()
+		self._thread = None
+		self.configure( **self.defaults )
+
+	@classmethod
+	def fromConfig ( cls, targetHost, targetPort, config ):
+		'''Create a proxy to the target from a configuration mapping with knobs, `suites` and optional `host` and `port`.'''
+		keys = cls.knobs + ( 'host', 'port', 'suites', 'seed' )
+		return cls( targetHost, targetPort, **{ key : config[key] for key in keys if key in config } )
+
+	@property
+	def address ( self ):
+		return self.server_address[:2]
+
+	def configure ( self, **knobs ):
+		'''Change the given knobs for all connections.'''
+		for name, value in knobs.items():
+			if name not in self.knobs:
+				raise ValueError( 'Unknown proxy setting `{0}`'.format( name ) )
+			setattr( self, name, value )
+
+	@contextmanager
+	def suite ( self, name ):
+		'''Apply the knob overrides configured for a suite file while in the block.'''
+		overrides = self.suites.get( name ) or self.suites.get( os.path.basename( name ) ) or {}
+		self.configure( **overrides )
+		try:
+			yield self
+		finally:
+			self.configure( **self.defaults )
+
+	def oneWayDelay ( self ):
+		if not self.jitter:
+			return self.delay
+		with self._lock:
+			return self.delay + self.random.uniform( 0, self.jitter )
+
+	def shouldReset ( self ):
+		if not self.resetRate:
+			return False
+		with self._lock:
+			return self.random.random() < self.resetRate
+
+	def count ( self, name, value ):
+		with self._lock:
+			self.stats[name] += value
+
+	def summary ( self ):
+		'''Return a line with the current shaping and the traffic so far.'''
+		with self._lock:
+			stats = dict( self.stats )
+		return 'Proxy: {delay:g}+{jitter:g} s delay, {0}, {1}, {resetRate:.1%} resets; {connections} connections, {resets} reset, {upstream} bytes up, {downstream} bytes down.'.format(
+			'{0:g} B/s'.format( self.bandwidth ) if self.bandwidth else 'unlimited', 'drip {0} B/{1:g} s'.format( self.dripBytes, self.dripInterval ) if self.dripBytes else 'no drip',
+			delay=self.delay, jitter=self.jitter, resetRate=self.resetRate, **stats )
+
+	def start ( self ):
+		self._thread = threading.Thread( name='ShapingProxy', target=self.serve_forever, daemon=True )
+		self._thread.start()
+		return self
+
+	def stop ( self ):
+		self.shutdown()
+		self.server_close()
+
+
+if __name__ == '__main__':
+	import argparse
+	parser = argparse.ArgumentParser( description='OCCI tent network shaping proxy', epilog=None )
+	parser.add_argument( 'target', help='target server as HOST:PORT' )
+	parser.add_argument( '--port', '-p', default=3001, type=int, help='port on which the proxy should listen (default: %(default)s)' )
+	parser.add_argument( '--delay', default=0.0, type=float, help='one-way delay in seconds (default: %(default)s)' )
+	parser.add_argument( '--jitter', default=0.0, type=float, help='additional random one-way delay in seconds (default: %(default)s)' )
+	parser.add_argument( '--bandwidth', type=float, help='bytes per second per connection and direction (default: unlimited)' )
+	parser.add_argument( '--drip-bytes', type=int, help='deliver responses in pieces of this many bytes' )
+	parser.add_argument( '--drip-interval', default=0.0, type=float, help='seconds between response pieces (default: %(default)s)' )
+	parser.add_argument( '--reset-rate', default=0.0, type=float, help='fraction of responses replaced by a connection reset (default: %(default)s)' )
+	args = parser.parse_args()
+
+	host, _, port = args.target.rpartition( ':' )
+	proxy = ShapingProxy( host, port, '', args.port, delay=args.delay, jitter=args.jitter, bandwidth=args.bandwidth,
+		dripBytes=args.drip_bytes, dripInterval=args.drip_interval, resetRate=args.reset_rate )
+	print( 'Proxying {0}:{1} to {2}:{3}...'.format( *proxy.address, *proxy.target ) )
+	try:
+		proxy.serve_forever()
+	except KeyboardInterrupt:
+		proxy.server_close()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+'''
+OCCI tent result sinks and readers.
+'''
+
+from datetime import datetime
+import json
+
+from .util import safeRepr
+
+__all__ = [ 'JSONLinesSink', 'ResultSink', 'ResultTotals', 'caseRecord', 'formatRun', 'readRun', 'readRuns' ]
+
+def caseRecord ( case, t ):
+	'''Return the serializable record of a finished test case; the log is formatted here.'''
+	return {
+		'type' : 'case',
+		'title' : t['title'],
+		'failed' : t['failed'],
+		'skipped' : t['skipped'],
+		'result' : None if t['result'] is None else safeRepr( t['result'] ),
+		'timings' : t['timings'],
+		'log' : t['log'].lines() }
+
+
+class ResultTotals:
+	'''Running totals of finished test cases.'''
+
+	def __init__ ( self ):
+		self.total = 0
+		self.failed = 0
+		self.skipped = 0
+
+	def add ( self, t ):
+		self.total += 1
+		if t['skipped']:
+			self.skipped += 1
+		if t['failed']:
+			self.failed += 1
+
+	@property
+	def successful ( self ):
+		return self.total - self.failed - self.skipped
+
+
+class ResultSink:
+	'''
+	Destination of finished test cases. `Tent.runTests` calls `start` once,
+	`write` for every case in suite order and `finish` with the totals and
+	summary lines. The base sink discards everything.
+	'''
+
+	def start ( self, **info ):
+		pass
+
+	def write ( self, case, t ):
+		pass
+
+	def finish ( self, totals, summary ):
+		pass
+
+
+class JSONLinesSink ( ResultSink ):
+	'''
+	Append every run to a JSON Lines file: a `run` header, one `case` line per
+	test case and a closing `summary` line. Cases are written as they finish,
+	so nothing but the running totals has to stay in memory.
+	'''
+
+	def __init__ ( self, fileName, suite = None ):
+		self.fileName = fileName
+		self.suite = suite
+		self._file = None
+
+	def _write ( self, record ):
+		self._file.write( json.dumps( record, default=safeRepr, separators=( ',', ':' ) ) + '\n' )
+
+	def start ( self, **info ):
+		self._file = open( self.fileName, 'a' )
+		header = { 'type' : 'run', 'suite' : self.suite, 'started' : datetime.utcnow().isoformat( ' ' ) }
+		header.update( info )
+		self._write( header )
+
+	def write ( self, case, t ):
+		self._write( caseRecord( case, t ) )
+
+	def finish ( self, totals, summary ):
+		self._write( { 'type' : 'summary', 'total' : totals.total, 'failed' : totals.failed, 'skipped' : totals.skipped, 'lines' : summary } )
+		self._file.close()
+		self._file = None
+
+
+def readRuns ( fileName ):
+	'''Return `( offset, header )` pairs of all runs in a results file.'''
+	runs = []
+	with open( fileName, 'rb' ) as f:
+		offset = 0
+		for line in f:
+			if line.startswith( b'{"type":"run"' ):
+				runs.append( ( offset, json.loads( line.decode() ) ) )
+			offset += len( line )
+	return runs
+
+def readRun ( fileName, offset = None ):
+	'''
+	Yield the records of the run starting at the given offset, or of the last
+	run, from a results file: the `run` header, its cases and the summary.
+	'''
+	if offset is None:
+		runs = readRuns( fileName )
+		if not runs:
+			return
+		offset = runs[-1][0]
+
+	with open( fileName, 'rb' ) as f:
+		f.seek( offset )
+		for i, line in enumerate( f ):
+			record = json.loads( line.decode() )
+			if i and record['type'] == 'run':
+				break
+			yield record
+
+def formatRun ( records ):
+	'''Yield the text output of a run, as printed by `Tent.runTests`, from its records.'''
+	for record in records:
+		if record['type'] == 'case':
+			yield 'Test: ' + record['title']
+			for line in record['log']:
+				yield '    ' + line
+		elif record['type'] == 'summary':
+			yield ''
+			yield from record['lines']
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+'''
+OCCI tent test case dependency graph and scheduler.
+'''
+
+from concurrent.futures import Future, ThreadPoolExecutor
+import threading, time
+
+__all__ = [ 'TestGraph', 'TestNode' ]
+
+class TestNode:
+	'''Test case in a dependency graph with its execution record and timing.'''
+	__slots__ = ( 'index', 'case', 'depends', 'dependents', 'future', 'start', 'end' )
+
+	def __init__ ( self, index, case ):
+		self.index = index
+		self.case = case
+		self.depends = []
+		self.dependents = []
+		self.future = Future()
+		self.start = None
+		self.end = None
+
+	@property
+	def duration ( self ):
+		return self.end - self.start if self.end is not None else 0.0
+
+	@property
+	def record ( self ):
+		'''Execution record of the finished test case, or None if it raised.'''
+		if self.future is not None and self.future.done() and not self.future.exception():
+			return self.future.result()
+		return None
+
+
+class TestGraph:
+	'''
+	Dependency graph of test cases. A test case names the values it `provides`
+	and the values it `depends` on; a case runs only after all providers of its
+	dependencies have finished, and receives their results as parameters of its
+	first module, the way `chain` passes results within a case.
+	'''
+
+	def __init__ ( self, testCases ):
+		self.nodes = [ TestNode( i, case ) for i, case in enumerate( testCases ) ]
+		self.wallTime = None
+		self.workers = None
+
+		self.providers = {}
+		for node in self.nodes:
+			for name in node.case.provides:
+				if name in self.providers:
+					raise ValueError( 'Value `{0}` is provided by both `{1}` and `{2}`'.format( name, self.providers[name].case.title, node.case.title ) )
+				self.providers[name] = node
+
+		for node in self.nodes:
+			for name in node.case.depends:
+				provider = self.providers.get( name )
+				if provider is None:
+					raise ValueError( 'Test case `{0}` depends on unknown value `{1}`'.format( node.case.title, name ) )
+				if provider is node:
+					raise ValueError( 'Test case `{0}` depends on itself'.format( node.case.title ) )
+				if provider not in node.depends:
+					node.depends.append( provider )
+					provider.dependents.append( node )
+
+		self.order = self._topologicalOrder()
+
+	def __len__ ( self ):
+		return len( self.nodes )
+
+	@property
+	def hasDependencies ( self ):
+		return bool( self.providers )
+
+	def _topologicalOrder ( self ):
+		'''Return the nodes in an order respecting all dependencies, preferring suite order.'''
+		pending = { node : len( node.depends ) for node in self.nodes }
+		ready = [ node for node in self.nodes if not node.depends ]
+		order = []
+		while ready:
+			ready.sort( key=lambda node: node.index, reverse=True )
+			node = ready.pop()
+			order.append( node )
+			for dependent in node.dependents:
+				pending[dependent] -= 1
+				if not pending[dependent]:
+					ready.append( dependent )
+
+		if len( order ) < len( self.nodes ):
+			cycle = [ node.case.title for node in self.nodes if pending[node] ]
+			raise ValueError( 'Circular test case dependencies between: ' + ', '.join( cycle ) )
+		return order
+
+	def run ( self, execute, workers = 1 ):
+		'''
+		Run the graph on `workers` threads with as much concurrency as the
+		dependencies allow. `execute( case, dependencies )` is called with the
+		execution records of the case's providers by value name and returns the
+		case's record. Yield `( case, record )` pairs in suite order.
+		'''
+		lock = threading.Lock()
+		pending = { node : len( node.depends ) for node in self.nodes }
+		# a record is held until it has been yielded and all dependents have finished
+		holders = { node : len( node.dependents ) + 1 for node in self.nodes }
+		self.workers = workers
+
+		def release ( node ):
+			with lock:
+				holders[node] -= 1
+				if not holders[node]:
+					node.future = None
+
+		def work ( node ):
+			node.start = time.perf_counter()
+			try:
+				dependencies = { name : self.providers[name].record for name in node.case.depends }
+				node.future.set_result( execute( node.case, dependencies ) )
+			except BaseException as e:
+				node.future.set_exception( e )
+			finally:
+				node.end = time.perf_counter()
+				dependencies = None
+				for provider in node.depends:
+					release( provider )
+				ready = []
+				with lock:
+					for dependent in node.dependents:
+						pending[dependent] -= 1
+						if not pending[dependent]:
+							ready.append( dependent )
+				for dependent in ready:
+					executor.submit( work, dependent )
+
+		start = time.perf_counter()
+		with ThreadPoolExecutor( max_workers=workers ) as executor:
+			for node in self.order:
+				if not node.depends:
+					executor.submit( work, node )
+
+			for node in self.nodes:
+				record = node.future.result()
+				release( node )
+				yield node.case, record
+				record = None
+			self.wallTime = time.perf_counter() - start
+
+	def criticalPath ( self ):
+		'''Return the duration and nodes of the longest dependency chain of the last run.'''
+		finish, previous = {}, {}
+		for node in self.order:
+			before = max( node.depends, key=lambda d: finish[d], default=None )
+			finish[node] = node.duration + ( finish[before] if before else 0.0 )
+			previous[node] = before
+
+		node = max( self.nodes, key=lambda n: finish[n], default=None )
+		if node is None:
+			return 0.0, []
+		length, path = finish[node], []
+		while node is not None:
+			path.append( node )
+			node = previous[node]
+		return length, path[::-1]
+
+	def summary ( self ):
+		'''Return a line comparing the critical path length with the achieved wall time.'''
+		length, path = self.criticalPath()
+		busy = sum( node.duration for node in self.nodes )
+		return 'Schedule: critical path {0:.1f} ms over {1} cases, wall time {2:.1f} ms with {3} workers ({4:.1f} ms of work).'.format(
+			length * 1000, len( path ), ( self.wallTime or 0.0 ) * 1000, self.workers, busy * 1000 )
@@ -3,17 +3,34 @@
 OCCI tent core.
 '''
 
-import os, inspect
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from itertools import islice
+import os, inspect, threading, time
 
-from .client import OCCIClient
+from .cache import HTTPCache
+from .cassette import openCassette
+from .client import OCCIClient, OCCIResponse
+from .load import CapacitySearch, LoadGenerator, RateGenerator, ServiceLevel, TrafficReplay, moduleCall, readRequestLog, requestCall
+from .metrics import Instrumentation, ModuleStats
+from .mock import MockOCCIServer
+from .proxy import ShapingProxy
+from .results import ResultSink, ResultTotals
+from .schedule import TestGraph
 from .tester import Tester
-from .util import clonedPrinter
+from .util import LRUCache, clonedPrinter
 from .yaml import *
 import tests
 
 class Tent:
 	_modules = None
 	_suites = None
+	profile = None
+	mockServer = None
+	proxy = None
+	_tracer = None
+	_cassette = None
 	
 	def __init__ ( self, configurationFile ):
 		if isinstance( configurationFile, str ):
@@ -24,7 +41,65 @@ class Tent:
 		self.serverHost = self.rawConfig['host']
 		self.serverPort = self.rawConfig['port']
 		
-		self.client = OCCIClient( self.serverHost, self.serverPort )
+		mock = self.rawConfig.get( 'mock' )
+		if mock:
+			self.mockServer = MockOCCIServer.fromConfig( mock if isinstance( mock, dict ) else {} ).start()
+			self.serverHost, self.serverPort = self.mockServer.address
+		
+		proxy = self.rawConfig.get( 'proxy' )
+		if proxy:
+			self.proxy = ShapingProxy.fromConfig( self.serverHost, self.serverPort, proxy if isinstance( proxy, dict ) else {} ).start()
+			self.serverHost, self.serverPort = self.proxy.address
+		
+		httpCacheSize = self.rawConfig.get( 'httpCacheSize', 0 )
+		self.client = self.makeClient(
+			cache=HTTPCache( httpCacheSize ) if httpCacheSize else None,
+			instrumentation=Instrumentation() if self.rawConfig.get( 'instrumentation' ) else None )
+		
+		cassette = self.rawConfig.get( 'cassette' )
+		if cassette:
+			self.cassette = openCassette( cassette['file'], cassette.get( 'mode', 'record' ), cassette.get( 'latency', 0.0 ) )
+		
+		if 'logLimit' in self.rawConfig:
+			Tester.logLimit = self.rawConfig['logLimit']
+		
+		parseCacheSize = self.rawConfig.get( 'parseCacheSize', OCCIResponse.parseCache.maxSize )
+		OCCIResponse.parseCache = LRUCache( parseCacheSize ) if parseCacheSize else None
+	
+	@property
+	def tracer ( self ):
+		'''Timeline recorder (`inc.trace.TraceRecorder`) of all clients, or None if disabled.'''
+		return self._tracer
+	
+	@tracer.setter
+	def tracer ( self, tracer ):
+		self._tracer = tracer
+		self.client.tracer = tracer
+	
+	@property
+	def cassette ( self ):
+		'''Cassette (`inc.cassette`) all clients record their exchanges to or replay them from, or None if disabled.'''
+		return self._cassette
+	
+	@cassette.setter
+	def cassette ( self, cassette ):
+		self._cassette = cassette
+		self.client.transport = cassette.transport( self.client.transport )
+	
+	def makeClient ( self, cache = None, instrumentation = None ):
+		'''Create a new client for the configured server.'''
+		client = OCCIClient( self.serverHost, self.serverPort,
+			poolSize=self.rawConfig.get( 'poolSize', 4 ),
+			idleTimeout=self.rawConfig.get( 'idleTimeout', 30 ),
+			timeout=self.rawConfig.get( 'timeout' ),
+			cache=cache,
+			compression=self.rawConfig.get( 'compression', True ),
+			compressMinSize=self.rawConfig.get( 'compressMinSize' ),
+			instrumentation=instrumentation )
+		client.tracer = self._tracer
+		if self._cassette is not None:
+			client.transport = self._cassette.transport( client.transport )
+		return client
 	
 	def runTest ( self, module, args ):
 		if module not in tests.modules:
@@ -35,7 +110,7 @@ class Tent:
 		t = tester.current
 		
 		print( 'Test: ' + t['test'].__name__ )
-		print( '\n'.join( t['log'] ) )
+		print( '\n'.join( t['log'].lines() ) )
 		
 		if t['skipped']:
 			print( 'Test skipped.' )
@@ -44,46 +119,265 @@ class Tent:
 		else:
 			print( 'Test successful.' )
 	
-	def runSuite ( self, suiteFile, logFile = None, suppressPrint = False ):
-		'''Run test suite.'''
-		testCases = self.loadTestCases( suiteFile )
-		return self.runTests( testCases, logFile, suppressPrint=suppressPrint )
+	def runLoad ( self, module, concurrency = 1, requests = None, duration = None, parameters = None, logFile = None, suppressPrint = False ):
+		'''
+		Call a test module repeatedly on `concurrency` workers, for a number of
+		calls or a duration in seconds, and print throughput and latencies.
+		'''
+		if module not in tests.modules:
+			raise ValueError( 'Unknown test method' )
+		
+		print = clonedPrinter( logFile, suppressPrint=suppressPrint )
+		generator = LoadGenerator( lambda instrumentation: self.makeClient( instrumentation=instrumentation ),
+			tests.modules[module], name=module, parameters=parameters, concurrency=concurrency )
+		result = generator.run( requests=requests, duration=duration )
+		print( '\n'.join( result.summary() ) )
+		return result
 	
-	def runTests ( self, testCases, logFile = None, suppressPrint = False ):
-		'''Run test cases.'''
-		tester = Tester( self.client )
-		total, failed, skipped = 0, 0, 0
+	def runRate ( self, rate, endRate = None, duration = 60, module = None, request = None, parameters = None,
+			workers = 64, seriesFile = None, logFile = None, suppressPrint = False ):
+		'''
+		Start calls of a test module, or raw `( method, path )` requests, at a
+		fixed or linearly ramped arrival rate and print latencies measured from
+		the intended start of each call. Write the time series as CSV to
+		`seriesFile` if given.
+		'''
+		if module is not None:
+			if module not in tests.modules:
+				raise ValueError( 'Unknown test method' )
+			name, call = module, moduleCall( tests.modules[module], module, parameters )
+		else:
+			name, call = '{0} {1}'.format( *request ), requestCall( *request )
+		
+		print = clonedPrinter( logFile, suppressPrint=suppressPrint )
+		generator = RateGenerator( self.makeClient, call, name, rate, endRate=endRate, duration=duration, workers=workers )
+		result = generator.run()
+		print( '\n'.join( result.summary() ) )
+		if seriesFile is not None:
+			if isinstance( seriesFile, str ):
+				with open( seriesFile, 'w', newline='' ) as f:
+					result.writeSeries( f )
+			else:
+				result.writeSeries( seriesFile )
+		return result
+	
+	def runCapacity ( self, module, serviceLevel, startRate = 10, stepDuration = 10, maxRate = 10000, minRate = 1.0, parameters = None,
+			workers = 64, logFile = None, suppressPrint = False ):
+		'''
+		Find the highest arrival rate of calls of a test module that still meets
+		the service level objective, e.g. `p99<200ms,errors<1%`, by stepping the
+		rate up and bisecting. Each step is an open-loop run of `stepDuration`
+		seconds. The search gives up if even `minRate` misses the objective.
+		'''
+		if module not in tests.modules:
+			raise ValueError( 'Unknown test method' )
+		if not isinstance( serviceLevel, ServiceLevel ):
+			serviceLevel = ServiceLevel( serviceLevel )
+		
 		print = clonedPrinter( logFile, suppressPrint=suppressPrint )
+		print( 'Capacity search for `{0}` with SLO {1}:'.format( module, serviceLevel ) )
+		call = moduleCall( tests.modules[module], module, parameters )
+		probe = lambda rate: RateGenerator( self.makeClient, call, module, rate, duration=stepDuration, workers=workers ).run()
+		search = CapacitySearch( probe, serviceLevel, startRate=startRate, maxRate=maxRate, minRate=minRate, report=print )
+		capacity = search.run()
 		
-		for case in testCases:
-			print( 'Test: ' + case.title )
-			tester.start( case.title )
+		if capacity is None:
+			print( 'Capacity: SLO {0} not met at {1:.1f} calls/s.'.format( serviceLevel, min( rate for rate, _, _ in search.steps ) ) )
+		else:
+			print( 'Capacity: {0:.1f} calls/s of `{1}` meet SLO {2} ({3} steps).'.format( capacity, module, serviceLevel, len( search.steps ) ) )
+		return capacity
+	
+	def runReplay ( self, requestLog, speed = 1.0, maxRate = None, workers = 16, requests = None, logFile = None, suppressPrint = False ):
+		'''
+		Replay a JSON Lines request log against the server at its original
+		timing, sped up by `speed`, or at `maxRate` requests per second, and
+		print per-endpoint latencies, status mismatches and throughput. Only
+		the first `requests` entries are replayed if given.
+		'''
+		entries = readRequestLog( requestLog )
+		if requests is not None:
+			entries = islice( entries, requests )
+		
+		print = clonedPrinter( logFile, suppressPrint=suppressPrint )
+		replay = TrafficReplay( self.makeClient, entries, getattr( requestLog, 'name', requestLog ), speed=speed, maxRate=maxRate, workers=workers )
+		result = replay.run()
+		print( '\n'.join( result.summary() ) )
+		return result
+	
+	def runSuite ( self, suiteFile, logFile = None, suppressPrint = False, jobs = 1, sink = None ):
+		'''Run test suite, with the proxy shaping configured for it if any.'''
+		testCases = self.loadTestCases( suiteFile )
+		name = getattr( suiteFile, 'name', suiteFile )
+		with ExitStack() as stack:
+			if self.proxy is not None:
+				stack.enter_context( self.proxy.suite( name ) )
+			if self._tracer is not None:
+				stack.enter_context( self._tracer.span( name, 'suite', jobs=jobs ) )
+			return self.runTests( testCases, logFile, suppressPrint=suppressPrint, jobs=jobs, sink=sink )
+	
+	def runTestCase ( self, tester, case, inputs = None ):
+		'''
+		Run the modules of a test case in order, chaining results, and return its
+		record. `inputs` are passed as additional parameters to the first module.
+		'''
+		tester.start( case.title )
+		start = time.perf_counter()
+		
+		for i, module in enumerate( case.modules ):
+			parameters = dict( module['parameters'] or {} )
+			if i == 0 and inputs:
+				for name, value in inputs.items():
+					parameters.setdefault( name, value )
+			if module['chain'] and module['chain'] not in parameters:
+				parameters[module['chain']] = tester.current['result']
 			
-			for module in case.modules:
-				parameters = module['parameters']
-				if module['chain'] and module['chain'] not in parameters:
-					parameters[module['chain']] = tester.current['result']
-				
-				tester.run( tests.modules[module['module']], args=parameters )
-				
-				if tester.current['skipped'] or tester.current['failed']:
-					break
+			tester.run( tests.modules[module['module']], args=parameters, profile=getattr( case, 'profile', None ) )
 			
-			t = tester.current
+			if tester.current['skipped'] or tester.current['failed']:
+				break
+		
+		if tester.client.tracer is not None:
+			tester.client.tracer.complete( case.title, 'case', start, time.perf_counter(), { 'failed' : tester.current['failed'], 'skipped' : tester.current['skipped'] } )
+		return tester.current
+	
+	def runTests ( self, testCases, logFile = None, suppressPrint = False, jobs = 1, sink = None ):
+		'''
+		Run test cases. With more than one job, test cases run concurrently on
+		a pool of workers, each with its own tester and client; modules within
+		a case still run in order, and output keeps the order of the suite.
+		If test cases declare dependencies, they are scheduled as a graph.
+		Finished cases are passed to the result `sink`, if any, and dropped;
+		only running totals are kept for the summary.
+		'''
+		print = clonedPrinter( logFile, suppressPrint=suppressPrint )
+		if self.client.cache is not None:
+			self.client.cache.resetStats()
+		if self.client.instrumentation is not None:
+			self.client.instrumentation.reset()
+		if sink is None:
+			sink = ResultSink()
+		
+		testCases = list( testCases )
+		graph = TestGraph( testCases )
+		clients = [ self.client ]
+		if graph.hasDependencies:
+			results = self._executeGraph( graph, jobs, clients, print )
+		else:
+			results = self._executeTests( testCases, jobs, clients, print )
+		
+		sink.start( jobs=jobs, cases=len( testCases ) )
+		totals = ResultTotals()
+		modules = ModuleStats()
+		profiles = []
+		for case, t in results:
 			if t['log']:
-				print( '    ' + '\n    '.join( t['log'] ) )
+				print( '    ' + '\n    '.join( t['log'].lines() ) )
 			
-			total += 1
-			if t['skipped']:
-				skipped += 1
-			if t['failed']:
-				failed += 1
+			totals.add( t )
+			for record in t['timings']:
+				modules.add( record )
+				if 'profile' in record or 'allocations' in record:
+					profiles.append( ( case.title, record ) )
+			sink.write( case, t )
+		
+		lines = [ 'Ran {0} tests: {1} successful, {2} failed, {3} skipped.'.format( totals.total, totals.successful, totals.failed, totals.skipped ) ]
+		if graph.hasDependencies:
+			lines.append( graph.summary() )
+		stats = {}
+		for client in clients:
+			for key, value in client.poolStats().items():
+				stats[key] = stats.get( key, 0 ) + value
+			if client is not self.client:
+				client.close()
+		lines.append( 'Connection pool: {hits} hits, {misses} misses.'.format( **stats ) )
+		if stats['responses']:
+			lines.append( 'Transfer: {wireBytes} bytes on the wire, {bodyBytes} bytes decoded, {0:.1f} ms decompressing.'.format( stats['decodeTime'] * 1000, **stats ) )
+		if self.proxy is not None:
+			lines.append( self.proxy.summary() )
+		if OCCIResponse.parseCache is not None:
+			lines.append( 'Parse cache: {hits} hits, {misses} misses, {evictions} evictions.'.format( **OCCIResponse.parseCache.stats() ) )
+		if self.client.cache is not None:
+			lines.append( 'HTTP cache: {hits} hits, {misses} misses, {invalidations} invalidations, {evictions} evictions.'.format( **self.client.cache.stats() ) )
+		if self.client.instrumentation is not None:
+			lines.extend( self.client.instrumentation.summary() )
+		
+		lines.extend( modules.lines() )
+		for title, record in profiles:
+			lines.append( 'Profile of `{0}` in `{1}`:'.format( record['module'], title ) )
+			if 'memoryPeak' in record:
+				lines.append( '  memory peak {memoryPeak} bytes, retained {memoryRetained} bytes'.format( **record ) )
+			lines.extend( '  ' + line for line in record.get( 'profile', [] ) + record.get( 'allocations', [] ) )
 		
 		print()
-		print( 'Ran {0} tests: {1} successful, {2} failed, {3} skipped.'.format( total, total - failed - skipped, failed, skipped ) )
+		print( '\n'.join( lines ) )
+		sink.finish( totals, lines )
+		return totals
+	
+	def _workerTester ( self, clients ):
+		'''Return a function returning the tester of the calling worker thread, each with its own client.'''
+		local = threading.local()
+		lock = threading.Lock()
+		
+		def workerTester ():
+			tester = getattr( local, 'tester', None )
+			if tester is None:
+				client = self.makeClient( cache=self.client.cache, instrumentation=self.client.instrumentation )
+				with lock:
+					clients.append( client )
+				tester = local.tester = Tester( client, profile=self.profile, keepTests=False )
+			return tester
+		return workerTester
+	
+	def _executeTests ( self, testCases, jobs, clients, print ):
+		'''Run the test cases and yield `( case, record )` pairs in suite order.'''
+		if jobs <= 1:
+			tester = Tester( self.client, profile=self.profile, keepTests=False )
+			for case in testCases:
+				print( 'Test: ' + case.title )
+				yield case, self.runTestCase( tester, case )
+			return
+		
+		workerTester = self._workerTester( clients )
+		with ThreadPoolExecutor( max_workers=jobs ) as executor:
+			# finished records are dropped as soon as they have been passed on
+			futures = deque( ( case, executor.submit( lambda case: self.runTestCase( workerTester(), case ), case ) ) for case in testCases )
+			while futures:
+				case, future = futures.popleft()
+				print( 'Test: ' + case.title )
+				record, future = future.result(), None
+				yield case, record
+	
+	def _executeGraph ( self, graph, jobs, clients, print ):
+		'''Run the test case graph and yield `( case, record )` pairs in suite order.'''
+		workerTester = self._workerTester( clients )
+		
+		def execute ( case, dependencies ):
+			tester = workerTester()
+			for name, record in dependencies.items():
+				if record is None or record['failed'] or record['skipped']:
+					tester.start( case.title )
+					tester.current['skipped'] = True
+					tester.log( 'Dependency `{0}` did not succeed.'.format( name ), level='skip' )
+					return tester.current
+			
+			inputs = {}
+			for name, parameter in case.depends.items():
+				if parameter:
+					inputs[parameter] = dependencies[name]['result']
+			return self.runTestCase( tester, case, inputs )
+		
+		for case, record in graph.run( execute, workers=max( jobs, 1 ) ):
+			print( 'Test: ' + case.title )
+			yield case, record
 	
 	def loadTestCases ( self, suiteFile ):
-		'''Load test cases from suite file.'''
+		'''
+		Load test cases from suite file. A test case may name values it
+		`provides` and values it `depends` on; `depends` is a single name, a list
+		of names, or a mapping from names to the parameter of the first module
+		receiving the providing test case's result. `profile` enables profiling
+		of the case's modules with `cprofile`, `tracemalloc` or `all`.
+		'''
 		if isinstance( suiteFile, str ):
 			suiteFile = open( suiteFile )
 		
@@ -93,6 +387,21 @@ class Tent:
 				t.__setstate__( testCase )
 				testCase = t
 			
+			depends = getattr( testCase, 'depends', None ) or {}
+			if isinstance( depends, str ):
+				depends = [ depends ]
+			if not isinstance( depends, dict ):
+				depends = dict.fromkeys( depends )
+			testCase.depends = depends
+			
+			provides = getattr( testCase, 'provides', None ) or []
+			if isinstance( provides, str ):
+				provides = [ provides ]
+			testCase.provides = list( provides )
+			
+			profile = getattr( testCase, 'profile', None )
+			testCase.profile = 'cprofile' if profile is True else profile or None
+			
 			for module in testCase.modules:
 				module.setdefault( 'module' )
 				module.setdefault( 'chain' )
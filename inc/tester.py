@@ -3,27 +3,45 @@
 OCCI tent tester.
 '''
 
+import time
+
 from .client import *
+from .metrics import ModuleTimer
 from .occi import *
-from .util import safeRepr, timestamp
+from .util import LogBuffer, LogRecord, safeRepr
 
 class SkipTestError ( Exception ):
 	pass
 
 class Tester:
 	failureException = AssertionError
+	logLimit = 1000
 
-	def __init__ ( self, client ):
+	def __init__ ( self, client, profile = None, keepTests = True ):
 		self.client = client
+		self.profile = profile
+		self.keepTests = keepTests
 		self.tests = []
 		self.current = None
+		self.module = None
 	
 	def request ( self, *args, **kwargs ):
 		return self.client.request( *args, **kwargs )
 	
-	def log ( self, *args, seperator=' ' ):
+	def requestMany ( self, requests, workers = None ):
+		'''Perform a batch of requests concurrently, see `OCCIClient.batch`, and log its statistics.'''
+		result = self.client.batch( requests, workers=workers )
+		self.log( 'Batch:', result.summary() )
+		return result
+	
+	def log ( self, *args, seperator=' ', level='info' ):
+		'''
+		Log the arguments for the current test. They are stored with a `LogRecord`
+		and only formatted when the log is printed; at most `logLimit` records
+		are kept per test.
+		'''
 		if self.current is not None:
-			self.current['log'].append( timestamp() + seperator.join( map( str, args ) ) )
+			self.current['log'].append( LogRecord( level, self.module, args, seperator ) )
 	
 	def start ( self, title='' ):
 		'''Start a new test case execution.'''
@@ -34,14 +52,22 @@ class Tester:
 			'result' : None,
 			'skipped' : False,
 			'failed' : False,
-			'log' : [] }
-		self.tests.append( self.current )
+			'timings' : [],
+			'log' : LogBuffer( self.logLimit ) }
+		if self.keepTests:
+			self.tests.append( self.current )
+		
+		instrumentation = getattr( self.client, 'instrumentation', None )
+		if instrumentation is not None:
+			instrumentation.case = title
 	
-	def run ( self, module, args = None, setUp = None, tearDown = None ):
+	def run ( self, module, args = None, setUp = None, tearDown = None, profile = None ):
 		'''
 		Run the given test module. Optionally set up the text fixture before
 		testing, and deconstruct it after testing if appropriate setUp and
-		tearDown callables are specified.
+		tearDown callables are specified. The module call is timed, and
+		profiled if `profile` or the tester's profile is set, see `ModuleTimer`;
+		the measurements are appended to the `timings` of the current test.
 		'''
 		if not isinstance( args, dict ):
 			args = {}
@@ -49,18 +75,29 @@ class Tester:
 		if setUp:
 			setUp( self )
 		
+		name = '{0}.{1}'.format( getattr( module, '__module__', '' ), getattr( module, '__name__', repr( module ) ) )
+		timer = ModuleTimer( name, self.client, profile=profile or self.profile )
+		start = time.perf_counter()
+		self.module = name
 		try:
 			self.current['modules'].append( module )
-			self.current['result'] = module( self, **args )
+			with timer:
+				self.current['result'] = module( self, **args )
 		except SkipTestError as e:
 			self.current['skipped'] = True
-			self.log( '[SKIP] ' + e.args[0] )
+			self.log( e.args[0], level='skip' )
 		except self.failureException as e:
 			self.current['failed'] = True
-			self.log( '[FAIL] ' + e.args[0] )
+			self.log( e.args[0], level='fail' )
 		except Exception as e:
 			self.current['failed'] = True
-			self.log( '[ERROR] Unhandled exception {0}: {1}'.format( type( e ).__name__, ', '.join( map( str, e.args ) ) ) )
+			self.log( 'Unhandled exception {0}: {1}'.format( type( e ).__name__, ', '.join( map( str, e.args ) ) ), level='error' )
+		self.module = None
+		
+		self.current['timings'].append( timer.record )
+		tracer = getattr( self.client, 'tracer', None )
+		if tracer is not None:
+			tracer.complete( name, 'module', start, time.perf_counter(), { 'failed' : self.current['failed'], 'skipped' : self.current['skipped'] } )
 		
 		if tearDown:
 			tearDown( self )
@@ -111,4 +148,12 @@ class Tester:
 	def assertNotIn ( self, expr, seq, msg = None ):
 		'''Fail if expression is in the sequence.'''
 		if expr in seq:
-			raise self._failException( msg, '{0} is in {1}', safeRepr( expr ), safeRepr( seq ) )
\ No newline at end of file
+			raise self._failException( msg, '{0} is in {1}', safeRepr( expr ), safeRepr( seq ) )
+	
+	def assertCategories ( self, categories, structures, msg = None ):
+		'''Fail if any of the categories is missing from the structures or `CategoryIndex`.'''
+		if not isinstance( structures, CategoryIndex ):
+			structures = CategoryIndex( structures )
+		missing = structures.missing( categories )
+		if missing:
+			raise self._failException( msg, 'Missing categories: {0}', ', '.join( '{0.scheme}{0.term}'.format( c ) for c in missing ) )
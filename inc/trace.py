@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+'''
+OCCI tent timeline export in Chrome trace-event format.
+'''
+
+import json, os, queue, threading, time
+
+__all__ = [ 'TraceRecorder' ]
+
+class TraceSpan:
+	'''Context manager recording a complete event when left.'''
+	__slots__ = ( 'recorder', 'name', 'category', 'args', 'start' )
+
+	def __init__ ( self, recorder, name, category, args ):
+		self.recorder = recorder
+		self.name = name
+		self.category = category
+		self.args = args
+		self.start = None
+
+	def __enter__ ( self ):
+		self.start = time.perf_counter()
+		return self
+
+	def __exit__ ( self, *exc ):
+		if exc[0] is not None:
+			self.args['error'] = exc[0].__name__
+		self.recorder.complete( self.name, self.category, self.start, time.perf_counter(), self.args )
+		return False
+
+
+class TraceRecorder:
+	'''
+	Recorder of nested spans (suite, test case, module, request, parse) that
+	writes them as a Chrome trace-event JSON array, viewable in Perfetto or
+	chrome://tracing. Every thread gets its own lane. Events are kept as
+	tuples in memory and only serialized by a background writer thread once
+	`bufferSize` events have accumulated, and on `close`.
+	'''
+	bufferSize = 10000
+
+	def __init__ ( self, file ):
+		self._file = open( file, 'w' ) if isinstance( file, str ) else file
+		self._origin = time.perf_counter()
+		self._pid = os.getpid()
+		self._lock = threading.Lock()
+		self._buffer = []
+		self._threads = {}
+		self._queue = queue.Queue()
+		self._first = True
+		self._writer = threading.Thread( name='TraceWriter', target=self._write, daemon=True )
+		self._writer.start()
+
+	def span ( self, name, category, **args ):
+		'''Return a context manager recording a span around its body.'''
+		return TraceSpan( self, name, category, args )
+
+	def complete ( self, name, category, start, end, args = None ):
+		'''Record a span between two `time.perf_counter` values on the calling thread's lane.'''
+		ident = threading.get_ident()
+		with self._lock:
+			if ident not in self._threads:
+				self._threads[ident] = ( len( self._threads ) + 1, threading.current_thread().name )
+			self._buffer.append( ( name, category, self._threads[ident][0], start, end, args ) )
+			if len( self._buffer ) < self.bufferSize:
+				return
+			events, self._buffer = self._buffer, []
+		self._queue.put( events )
+
+	def _event ( self, name, category, tid, start, end, args ):
+		event = { 'name' : name, 'cat' : category, 'ph' : 'X', 'pid' : self._pid, 'tid' : tid,
+			'ts' : round( ( start - self._origin ) * 1e6, 3 ), 'dur' : round( ( end - start ) * 1e6, 3 ) }
+		if args:
+			event['args'] = { key : value if isinstance( value, ( int, float, bool, type( None ) ) ) else str( value ) for key, value in args.items() }
+		return event
+
+	def _write ( self ):
+		while True:
+			events = self._queue.get()
+			if events is None:
+				break
+			chunk = ',\n'.join( json.dumps( self._event( *event ), separators=( ',', ':' ) ) for event in events )
+			if chunk:
+				self._file.write( ( '[\n' if self._first else ',\n' ) + chunk )
+				self._first = False
+
+	def close ( self ):
+		'''Write all buffered events and the thread names, and close the file.'''
+		with self._lock:
+			events, self._buffer = self._buffer, []
+			threads = sorted( self._threads.values() )
+		self._queue.put( events )
+		self._queue.put( None )
+		self._writer.join()
+
+		metadata = [ { 'name' : 'process_name', 'ph' : 'M', 'pid' : self._pid, 'args' : { 'name' : 'OCCI tent' } } ]
+		metadata.extend( { 'name' : 'thread_name', 'ph' : 'M', 'pid' : self._pid, 'tid' : tid, 'args' : { 'name' : name } } for tid, name in threads )
+		self._file.write( ( '[\n' if self._first else ',\n' ) + ',\n'.join( json.dumps( event, separators=( ',', ':' ) ) for event in metadata ) + '\n]\n' )
+		self._file.close()
@@ -0,0 +1,582 @@
+#!/usr/bin/env python3
+'''
+OCCI tent HTTP transports.
+'''
+
+import asyncio, gzip, http.client, io, socket, threading, time, urllib.parse, zlib
+
+__all__ = [ 'ConnectionPool', 'HTTPTransport', 'TransportResponse', 'DecodingResponse', 'TransferStats', 'AsyncHTTPTransport', 'BufferedResponse' ]
+
+class PooledConnection ( http.client.HTTPConnection ):
+	'''HTTP/1.1 connection that connects to the pool's cached server address.'''
+
+	def __init__ ( self, pool, timeout = None ):
+		super().__init__( pool.host, pool.port, timeout=timeout if timeout is not None else socket._GLOBAL_DEFAULT_TIMEOUT )
+		self.pool = pool
+		self.lastUsed = time.monotonic()
+		self.dnsTime = 0.0
+		self.connectTime = 0.0
+
+	def connect ( self ):
+		start = time.perf_counter()
+		address = self.pool.resolve()
+		resolved = time.perf_counter()
+		self.sock = socket.create_connection( address, self.timeout, self.source_address )
+		self.sock.setsockopt( socket.IPPROTO_TCP, socket.TCP_NODELAY, 1 )
+		self.dnsTime = resolved - start
+		self.connectTime = time.perf_counter() - resolved
+
+
+class ConnectionPool:
+	'''
+	Thread-safe pool of persistent HTTP/1.1 connections to a single server.
+	At most `size` idle connections are kept open; idle connections older than
+	`idleTimeout` seconds are discarded instead of being reused. The server
+	address is resolved once and cached for `resolveTimeout` seconds.
+	'''
+
+	def __init__ ( self, host, port, size = 4, idleTimeout = 30, timeout = None, resolveTimeout = 300 ):
+		self.host = host
+		self.port = int( port )
+		self.size = size
+		self.idleTimeout = idleTimeout
+		self.timeout = timeout
+		self.resolveTimeout = resolveTimeout
+		self.hits = 0
+		self.misses = 0
+		self._idle = []
+		self._address = None
+		self._resolved = 0
+		self._lock = threading.Lock()
+
+	def resolve ( self ):
+		'''Return the cached server address, resolving it if necessary.'''
+		with self._lock:
+			if self._address and time.monotonic() - self._resolved < self.resolveTimeout:
+				return self._address
+
+		address = socket.getaddrinfo( self.host, self.port, 0, socket.SOCK_STREAM )[0][4]
+		with self._lock:
+			self._address = address[:2]
+			self._resolved = time.monotonic()
+			return self._address
+
+	def acquire ( self ):
+		'''
+		Take an idle connection from the pool or create a new one. Return the
+		connection and whether it was reused.
+		'''
+		now = time.monotonic()
+		stale = []
+		with self._lock:
+			while self._idle:
+				conn = self._idle.pop()
+				if now - conn.lastUsed < self.idleTimeout:
+					self.hits += 1
+					break
+				stale.append( conn )
+			else:
+				conn = None
+				self.misses += 1
+
+		for c in stale:
+			c.close()
+
+		if conn:
+			return conn, True
+		return PooledConnection( self, self.timeout ), False
+
+	def release ( self, conn ):
+		'''Return a connection to the pool, or close it if the pool is full.'''
+		if conn.sock is None:
+			return
+
+		conn.lastUsed = time.monotonic()
+		with self._lock:
+			if len( self._idle ) < self.size:
+				self._idle.append( conn )
+				return
+		conn.close()
+
+	def close ( self ):
+		'''Close all idle connections.'''
+		with self._lock:
+			idle, self._idle = self._idle, []
+		for conn in idle:
+			conn.close()
+
+	def stats ( self ):
+		'''Return the pool hit and miss counts.'''
+		with self._lock:
+			return { 'hits' : self.hits, 'misses' : self.misses, 'idle' : len( self._idle ) }
+
+
+class TransportResponse:
+	'''
+	HTTP response wrapper that hands its connection back to the pool as soon
+	as the body has been consumed completely.
+	'''
+
+	def __init__ ( self, response, connection, pool ):
+		self.rsp = response
+		self.conn = connection
+		self.pool = pool
+		self.status = self.code = response.status
+		self.reason = response.reason
+		self.headers = response.msg
+
+	def info ( self ):
+		return self.headers
+
+	def getheader ( self, name, default = None ):
+		return self.rsp.getheader( name, default )
+
+	def getheaders ( self ):
+		return self.rsp.getheaders()
+
+	def read ( self, amt = None ):
+		data = self.rsp.read( amt )
+		self._releaseIfDone()
+		return data
+
+	def readline ( self, limit = -1 ):
+		line = self.rsp.readline( limit )
+		if not line and self.rsp.length == 0:
+			# http.client does not close a response drained by readline
+			self.rsp.close()
+		self._releaseIfDone()
+		return line
+
+	def __iter__ ( self ):
+		while True:
+			line = self.readline()
+			if not line:
+				break
+			yield line
+
+	def close ( self ):
+		'''Close the response; unread connections cannot be reused.'''
+		if self.conn is None:
+			return
+		if not self.rsp.isclosed():
+			self.rsp.close()
+			self.conn.close()
+		self._releaseIfDone()
+
+	def _releaseIfDone ( self ):
+		if self.conn is not None and self.rsp.isclosed():
+			conn, self.conn = self.conn, None
+			self.pool.release( conn )
+
+
+class TransferStats:
+	'''Thread-safe totals of transferred and decoded bytes.'''
+
+	def __init__ ( self ):
+		self.responses = 0
+		self.wireBytes = 0
+		self.bodyBytes = 0
+		self.decodeTime = 0.0
+		self._lock = threading.Lock()
+
+	def add ( self, wireBytes, bodyBytes, decodeTime ):
+		with self._lock:
+			self.responses += 1
+			self.wireBytes += wireBytes
+			self.bodyBytes += bodyBytes
+			self.decodeTime += decodeTime
+
+	def stats ( self ):
+		with self._lock:
+			return { 'responses' : self.responses, 'wireBytes' : self.wireBytes, 'bodyBytes' : self.bodyBytes, 'decodeTime' : self.decodeTime }
+
+
+class DecodingResponse:
+	'''
+	Response wrapper that decompresses a `gzip` or `deflate` encoded body
+	incrementally while it is read, so `readline` yields decoded lines without
+	waiting for the whole body. Bytes on the wire, decoded bytes and the time
+	spent decompressing are recorded on the response and, once the body is
+	consumed, added to the transport's `TransferStats`.
+	'''
+	chunkSize = 16384
+
+	def __init__ ( self, response, encoding = None, stats = None, timing = None ):
+		self.rsp = response
+		self.timing = timing
+		self.status = self.code = response.status
+		self.reason = response.reason
+		self.headers = response.headers
+		self.encoding = encoding
+		self.wireBytes = 0
+		self.bodyBytes = 0
+		self.decodeTime = 0.0
+		self._stats = stats
+		self._buffer = bytearray()
+		self._eof = False
+		if encoding == 'gzip':
+			self._decoder = zlib.decompressobj( 16 + zlib.MAX_WBITS )
+		elif encoding == 'deflate':
+			self._decoder = zlib.decompressobj()
+		else:
+			self._decoder = None
+
+	def info ( self ):
+		return self.headers
+
+	def getheader ( self, name, default = None ):
+		return self.rsp.getheader( name, default )
+
+	def getheaders ( self ):
+		return self.rsp.getheaders()
+
+	def _fill ( self ):
+		'''Read and decode the next chunk from the wire.'''
+		if self.timing is not None:
+			start = time.perf_counter()
+			data = self.rsp.read( self.chunkSize )
+			self.timing.body += time.perf_counter() - start
+			if not data:
+				self.timing.finish()
+		else:
+			data = self.rsp.read( self.chunkSize )
+		self.wireBytes += len( data )
+		if self._decoder is None:
+			self._buffer += data
+		else:
+			start = time.perf_counter()
+			try:
+				self._buffer += self._decoder.decompress( data ) if data else self._decoder.flush()
+			except zlib.error:
+				if self.encoding != 'deflate' or self.wireBytes != len( data ):
+					raise
+				# some servers send raw deflate streams without zlib header
+				self._decoder = zlib.decompressobj( -zlib.MAX_WBITS )
+				self._buffer += self._decoder.decompress( data )
+			self.decodeTime += time.perf_counter() - start
+		
+		if not data:
+			self._eof = True
+			if self._stats is not None:
+				self._stats.add( self.wireBytes, self.bodyBytes + len( self._buffer ), self.decodeTime )
+
+	def _take ( self, size ):
+		data = bytes( self._buffer[:size] )
+		del self._buffer[:size]
+		self.bodyBytes += len( data )
+		return data
+
+	def read ( self, amt = None ):
+		if amt is None or amt < 0:
+			while not self._eof:
+				self._fill()
+			return self._take( len( self._buffer ) )
+		
+		while len( self._buffer ) < amt and not self._eof:
+			self._fill()
+		return self._take( amt )
+
+	def readline ( self, limit = -1 ):
+		pos = self._buffer.find( b'\n' )
+		while pos < 0 and not self._eof and ( limit < 0 or len( self._buffer ) < limit ):
+			searched = len( self._buffer )
+			self._fill()
+			pos = self._buffer.find( b'\n', searched )
+		
+		size = pos + 1 if pos >= 0 else len( self._buffer )
+		if limit >= 0:
+			size = min( size, limit )
+		return self._take( size )
+
+	def __iter__ ( self ):
+		while True:
+			line = self.readline()
+			if not line:
+				break
+			yield line
+
+	def close ( self ):
+		self.rsp.close()
+
+
+class HTTPTransport:
+	'''
+	Pooled HTTP/1.1 keep-alive transport.
+	
+	Unless `compression` is disabled, gzip and deflate encoded responses are
+	accepted and decoded while being read. Request bodies of at least
+	`compressMinSize` bytes are sent gzip encoded; `None` never compresses.
+	
+	Like `urlopen`, redirects of GET and HEAD requests are followed, up to
+	`maxRedirects` times, as long as they stay on the same server; any other
+	redirect is returned as it is.
+	'''
+	retryErrors = ( http.client.RemoteDisconnected, http.client.BadStatusLine, ConnectionResetError, BrokenPipeError )
+	retryMethods = frozenset( ( 'GET', 'HEAD', 'OPTIONS', 'PUT' ) )
+	redirectStatuses = frozenset( ( 301, 302, 303, 307, 308 ) )
+	maxRedirects = 10
+	acceptEncoding = 'gzip, deflate'
+
+	def __init__ ( self, host, port, poolSize = 4, idleTimeout = 30, timeout = None, compression = True, compressMinSize = None, instrumentation = None ):
+		self.pool = ConnectionPool( host, port, size=poolSize, idleTimeout=idleTimeout, timeout=timeout )
+		self.compression = compression
+		self.compressMinSize = compressMinSize
+		self.instrumentation = instrumentation
+		self.transfer = TransferStats()
+
+	def perform ( self, method, path, headers, body = None ):
+		'''Send the request, following redirects, and return a `DecodingResponse`.'''
+		rsp = self._send( method, path, headers, body )
+		for i in range( self.maxRedirects ):
+			if method not in ( 'GET', 'HEAD' ) or rsp.status not in self.redirectStatuses:
+				break
+			target = self.redirectTarget( path, rsp.getheader( 'Location' ) )
+			if target is None:
+				break
+			rsp.read()
+			rsp.close()
+			path = target
+			rsp = self._send( method, path, headers, body )
+		return rsp
+
+	def redirectTarget ( self, path, location ):
+		'''Return the request path a redirect from `path` to `location` leads to, or None if it leaves the server.'''
+		if not location:
+			return None
+		pool = self.pool
+		url = urllib.parse.urlsplit( urllib.parse.urljoin( 'http://{0}:{1}{2}'.format( pool.host, pool.port, path ), location ) )
+		if url.scheme != 'http' or url.hostname != pool.host.lower() or ( url.port or 80 ) != pool.port:
+			return None
+		return ( url.path or '/' ) + ( '?' + url.query if url.query else '' )
+
+	def _send ( self, method, path, headers, body = None ):
+		'''
+		Send the request and return a `DecodingResponse`. A request failing
+		on a reused connection, which the server may have closed in the
+		meantime, is retried once on a fresh connection if it could not be
+		sent completely or its method is one of `retryMethods`; others may
+		have reached the server and are not repeated.
+		'''
+		if self.compression:
+			headers, body = self.encodeRequest( headers, body )
+		
+		timing = self.instrumentation.start( method, path ) if self.instrumentation is not None else None
+		conn, reused = self.pool.acquire()
+		sent = False
+		try:
+			conn.request( method, path, body, headers )
+			sent = True
+			rsp = conn.getresponse()
+		except self.retryErrors:
+			conn.close()
+			if not reused or sent and method not in self.retryMethods:
+				raise
+			conn = PooledConnection( self.pool, self.pool.timeout )
+			try:
+				conn.request( method, path, body, headers )
+				rsp = conn.getresponse()
+			except:
+				conn.close()
+				raise
+		except:
+			conn.close()
+			raise
+
+		if timing is not None:
+			timing.status = rsp.status
+			timing.dns, timing.connect = conn.dnsTime, conn.connectTime
+			timing.ttfb = time.perf_counter() - timing.start - timing.dns - timing.connect
+			conn.dnsTime = conn.connectTime = 0.0
+		
+		rsp = TransportResponse( rsp, conn, self.pool )
+		encoding = ( rsp.getheader( 'Content-Encoding' ) or '' ).strip().lower()
+		return DecodingResponse( rsp, encoding if encoding in ( 'gzip', 'deflate' ) else None, self.transfer, timing )
+
+	def encodeRequest ( self, headers, body ):
+		'''Add the accepted encodings and compress the body if it is large enough.'''
+		names = set( name.lower() for name in headers )
+		headers = dict( headers )
+		if 'accept-encoding' not in names:
+			headers['Accept-Encoding'] = self.acceptEncoding
+		
+		if body is not None and self.compressMinSize is not None and 'content-encoding' not in names:
+			if isinstance( body, str ):
+				body = body.encode( 'iso-8859-1' )
+			if len( body ) >= self.compressMinSize:
+				body = gzip.compress( body )
+				headers['Content-Encoding'] = 'gzip'
+		return headers, body
+
+	def stats ( self ):
+		stats = self.pool.stats()
+		stats.update( self.transfer.stats() )
+		return stats
+
+	def close ( self ):
+		self.pool.close()
+
+
+class BufferedResponse:
+	'''Completely received HTTP response with the file-like interface of `TransportResponse`.'''
+
+	def __init__ ( self, status, reason, headers, body ):
+		self.status = self.code = status
+		self.reason = reason
+		self.headers = headers
+		self._fp = io.BytesIO( body )
+
+	def info ( self ):
+		return self.headers
+
+	def getheader ( self, name, default = None ):
+		return self.headers.get( name, default )
+
+	def getheaders ( self ):
+		return list( self.headers.items() )
+
+	def read ( self, amt = None ):
+		return self._fp.read( amt )
+
+	def readline ( self, limit = -1 ):
+		return self._fp.readline( limit )
+
+	def __iter__ ( self ):
+		return iter( self._fp )
+
+	def close ( self ):
+		self._fp.close()
+
+
+class AsyncHTTPTransport:
+	'''
+	HTTP/1.1 keep-alive transport on asyncio streams. At most `concurrency`
+	requests are in flight at once, and as many connections are kept open.
+	'''
+	retryErrors = ( asyncio.IncompleteReadError, ConnectionResetError, BrokenPipeError )
+	retryMethods = HTTPTransport.retryMethods
+
+	def __init__ ( self, host, port, concurrency = 16, idleTimeout = 30, timeout = None ):
+		self.host = host
+		self.port = int( port )
+		self.concurrency = concurrency
+		self.idleTimeout = idleTimeout
+		self.timeout = timeout
+		self.hits = 0
+		self.misses = 0
+		self._idle = []
+		self._loop = None
+		self._semaphore = None
+
+	def _bind ( self ):
+		'''Bind the transport to the running event loop, dropping connections of a previous loop.'''
+		loop = asyncio.get_running_loop()
+		if loop is not self._loop:
+			self._loop = loop
+			self._idle = []
+			self._semaphore = asyncio.Semaphore( self.concurrency )
+
+	async def _acquire ( self ):
+		now = time.monotonic()
+		while self._idle:
+			reader, writer, lastUsed = self._idle.pop()
+			if now - lastUsed < self.idleTimeout and not reader.at_eof():
+				self.hits += 1
+				return reader, writer, True
+			writer.close()
+
+		self.misses += 1
+		reader, writer = await asyncio.wait_for( asyncio.open_connection( self.host, self.port ), self.timeout )
+		return reader, writer, False
+
+	async def perform ( self, method, path, headers, body = None ):
+		'''
+		Send the request and return a `BufferedResponse`. Like with
+		`HTTPTransport`, a request of one of `retryMethods` failing on a
+		reused connection is retried once on a fresh connection.
+		'''
+		self._bind()
+		async with self._semaphore:
+			reader, writer, reused = await self._acquire()
+			try:
+				try:
+					rsp, keepAlive = await asyncio.wait_for( self._exchange( reader, writer, method, path, headers, body ), self.timeout )
+				except self.retryErrors:
+					if not reused or method not in self.retryMethods:
+						raise
+					writer.close()
+					self.misses += 1
+					reader, writer = await asyncio.wait_for( asyncio.open_connection( self.host, self.port ), self.timeout )
+					rsp, keepAlive = await asyncio.wait_for( self._exchange( reader, writer, method, path, headers, body ), self.timeout )
+			except:
+				writer.close()
+				raise
+
+			if keepAlive:
+				self._idle.append( ( reader, writer, time.monotonic() ) )
+			else:
+				writer.close()
+			return rsp
+
+	async def _exchange ( self, reader, writer, method, path, headers, body ):
+		'''Write the request and read the complete response.'''
+		if isinstance( body, str ):
+			body = body.encode( 'iso-8859-1' )
+
+		lines = [ '{0} {1} HTTP/1.1'.format( method, path ) ]
+		names = set( name.lower() for name in headers )
+		if 'host' not in names:
+			lines.append( 'Host: {0}:{1}'.format( self.host, self.port ) )
+		if 'accept-encoding' not in names:
+			lines.append( 'Accept-Encoding: identity' )
+		if body is not None and 'content-length' not in names:
+			lines.append( 'Content-Length: ' + str( len( body ) ) )
+		lines.extend( '{0}: {1}'.format( name, value ) for name, value in headers.items() )
+
+		writer.write( ( '\r\n'.join( lines ) + '\r\n\r\n' ).encode( 'iso-8859-1' ) )
+		if body:
+			writer.write( body )
+		await writer.drain()
+
+		statusLine = await reader.readline()
+		if not statusLine:
+			raise ConnectionResetError( 'Connection closed by server' )
+		version, status, *reason = statusLine.decode( 'iso-8859-1' ).split( None, 2 )
+		status = int( status )
+
+		rawHeaders = []
+		while True:
+			line = await reader.readline()
+			rawHeaders.append( line )
+			if line in ( b'\r\n', b'\n', b'' ):
+				break
+		rspHeaders = http.client.parse_headers( io.BytesIO( b''.join( rawHeaders ) ) )
+
+		keepAlive = version != 'HTTP/1.0' and rspHeaders.get( 'Connection', '' ).lower() != 'close'
+		if method == 'HEAD' or status in ( 204, 304 ) or 100 <= status < 200:
+			data = b''
+		elif rspHeaders.get( 'Transfer-Encoding', '' ).lower() == 'chunked':
+			chunks = []
+			while True:
+				size = int( ( await reader.readline() ).split( b';' )[0], 16 )
+				if size == 0:
+					while ( await reader.readline() ) not in ( b'\r\n', b'\n', b'' ):
+						pass
+					break
+				chunks.append( await reader.readexactly( size ) )
+				await reader.readexactly( 2 )
+			data = b''.join( chunks )
+		elif rspHeaders.get( 'Content-Length' ) is not None:
+			data = await reader.readexactly( int( rspHeaders['Content-Length'] ) )
+		else:
+			data = await reader.read()
+			keepAlive = False
+
+		return BufferedResponse( status, reason[0].strip() if reason else '', rspHeaders, data ), keepAlive
+
+	def stats ( self ):
+		return { 'hits' : self.hits, 'misses' : self.misses, 'idle' : len( self._idle ) }
+
+	async def close ( self ):
+		idle, self._idle = self._idle, []
+		for reader, writer, lastUsed in idle:
+			writer.close()
@@ -3,7 +3,8 @@
 OCCI tent utilties.
 '''
 
-import time
+from collections import OrderedDict, deque
+import math, threading, time
 import urllib.parse, urllib.request
 
 class Request ( urllib.request.Request ):
@@ -21,6 +22,63 @@ class Request ( urllib.request.Request ):
 			return 'GET'
 
 
+class LRUCache:
+	'''Thread-safe, size-bounded mapping that evicts the least recently used entries.'''
+	
+	def __init__ ( self, maxSize = 1024 ):
+		self.maxSize = maxSize
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self._data = OrderedDict()
+		self._lock = threading.Lock()
+	
+	def get ( self, key, default = None ):
+		'''Return the cached value and mark it as recently used.'''
+		with self._lock:
+			try:
+				value = self._data[key]
+			except KeyError:
+				self.misses += 1
+				return default
+			self._data.move_to_end( key )
+			self.hits += 1
+			return value
+	
+	def put ( self, key, value ):
+		'''Cache the value, evicting the least recently used entries if full.'''
+		with self._lock:
+			self._data[key] = value
+			self._data.move_to_end( key )
+			while len( self._data ) > self.maxSize:
+				self._data.popitem( last=False )
+				self.evictions += 1
+	
+	def pop ( self, key, default = None ):
+		with self._lock:
+			return self._data.pop( key, default )
+	
+	def clear ( self ):
+		with self._lock:
+			self._data.clear()
+	
+	def items ( self ):
+		'''Return a snapshot of the cached items, without affecting their recency.'''
+		with self._lock:
+			return list( self._data.items() )
+	
+	def __len__ ( self ):
+		return len( self._data )
+	
+	def __contains__ ( self, key ):
+		return key in self._data
+	
+	def stats ( self ):
+		'''Return the hit, miss and eviction counts.'''
+		with self._lock:
+			return { 'hits' : self.hits, 'misses' : self.misses, 'evictions' : self.evictions, 'size' : len( self._data ) }
+
+
 def quote ( text, safe = '~' ):
 	'''Quote variable text. Defaults to RFC3986 behaviour.'''
 	if isinstance( text, bytes ):
@@ -34,6 +92,12 @@ def urlencodeData ( data = None ):
 	except AttributeError:
 		return data
 
+def percentile ( sortedValues, fraction ):
+	'''Return the value at the given fraction (0..1) of a sorted sequence, using the nearest rank.'''
+	if not sortedValues:
+		return None
+	return sortedValues[min( len( sortedValues ) - 1, max( 0, math.ceil( fraction * len( sortedValues ) ) - 1 ) )]
+
 def safeRepr ( obj ):
 	'''Generate a safe string representation of the given object.'''
 	try:
@@ -41,11 +105,74 @@ def safeRepr ( obj ):
 	except Exception:
 		return object.__repr__( obj )
 
-def timestamp ():
-	'''Generate a timestamp string of the current time.'''
-	t = time.time()
+_monotonicOffset = time.time() - time.monotonic()
+
+def timestamp ( t = None ):
+	'''Generate a timestamp string of the given or the current time.'''
+	if t is None:
+		t = time.time()
 	return '{:02g}:{:02g}:{:07.4f}: '.format( t // 3600 % 24, t // 60 % 60, t % 60 )
 
+class LogRecord:
+	'''
+	Log event of a test: monotonic time, level, running module and logged
+	arguments. The arguments are kept as references and only converted to
+	text when the record is formatted.
+	'''
+	__slots__ = ( 'time', 'level', 'module', 'args', 'separator' )
+	prefixes = { 'info' : '', 'skip' : '[SKIP] ', 'fail' : '[FAIL] ', 'error' : '[ERROR] ' }
+
+	def __init__ ( self, level, module, args, separator = ' ' ):
+		self.time = time.monotonic()
+		self.level = level
+		self.module = module
+		self.args = args
+		self.separator = separator
+	
+	@property
+	def wallTime ( self ):
+		return self.time + _monotonicOffset
+	
+	@property
+	def message ( self ):
+		return self.prefixes.get( self.level, '' ) + self.separator.join( map( str, self.args ) )
+	
+	def __str__ ( self ):
+		return timestamp( self.wallTime ) + self.message
+
+
+class LogBuffer:
+	'''
+	Log records of a test case. With `maxRecords` set, only the most recent
+	records are kept and older ones are counted as dropped.
+	'''
+
+	def __init__ ( self, maxRecords = None ):
+		self._records = deque( maxlen=maxRecords )
+		self.dropped = 0
+	
+	def append ( self, record ):
+		if self._records.maxlen is not None and len( self._records ) == self._records.maxlen:
+			self.dropped += 1
+		self._records.append( record )
+	
+	def __len__ ( self ):
+		return len( self._records )
+	
+	def __iter__ ( self ):
+		return iter( self._records )
+	
+	def __getitem__ ( self, index ):
+		return self._records[index]
+	
+	def lines ( self ):
+		'''Return the formatted log lines.'''
+		lines = [ str( record ) for record in self._records ]
+		if self.dropped:
+			lines.insert( 0, '[{0} earlier log records dropped]'.format( self.dropped ) )
+		return lines
+
+
 def clonedPrinter ( secondChannel, suppressPrint = False ):
 	'''Clone the printer to a second channel if it exists.'''
 	if suppressPrint:
@@ -70,4 +197,9 @@ def suiteOpener ( *args, **kwargs ):
 			if not path.endswith( '.yaml' ):
 				path += '.yaml'
 			return open( path, **kwargs )
-		raise
\ No newline at end of file
+		raise
+
+def rateRange ( value ):
+	'''Parse an arrival rate `R`, or a ramp `R:R2`, into a `( start, end )` tuple.'''
+	rates = tuple( map( float, value.split( ':', 1 ) ) )
+	return rates if len( rates ) == 2 else ( rates[0], None )
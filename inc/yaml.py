@@ -45,6 +45,9 @@ class YamlTest ( YAMLObject ):
 	def __init__ ( self, title = '' ):
 		self.title = title
 		self.modules = []
+		self.depends = {}
+		self.provides = []
+		self.profile = None
 	
 	def __setstate__ ( self, state ):
 		self.__dict__.update( state )
\ No newline at end of file
@@ -5,21 +5,48 @@ OCCI tent command line interface.
 
 from datetime import datetime
 from itertools import islice
-import argparse, sys
+import argparse, atexit, sys
 
+from inc.cassette import openCassette
+from inc.metrics import Instrumentation
+from inc.results import JSONLinesSink, formatRun, readRun
 from inc.tent import Tent
-from inc.util import suiteOpener
+from inc.trace import TraceRecorder
+from inc.util import rateRange, suiteOpener
 from inc.yaml import YamlTest
 
 parser = argparse.ArgumentParser( description='OCCI tent command line interface', epilog=None )
 parser.add_argument( '--version', action='version', version='OCCI tent v1.0' )
 parser.add_argument( '--config', '-c', default='config.yaml', type=open, help='configuration file (default: %(default)s)', metavar='FILE' )
 parser.add_argument( '--modules', action='store_true', help='list all available test modules' )
+parser.add_argument( '--timings', action='store_true', help='record request timings and print a summary' )
+parser.add_argument( '--profile', action='store_true', help='profile every test module; profiled modules run one at a time' )
+parser.add_argument( '--profile-mode', default='cprofile', choices=( 'cprofile', 'tracemalloc', 'all' ), help='profile with cProfile, tracemalloc or both (default: %(default)s)' )
+parser.add_argument( '--trace', help='write a timeline of the run in Chrome trace-event format', metavar='FILE' )
+cassette = parser.add_mutually_exclusive_group()
+cassette.add_argument( '--record', help='record all exchanges with the server to a cassette file', metavar='FILE' )
+cassette.add_argument( '--playback', help='replay the exchanges of a cassette file instead of contacting the server', metavar='FILE' )
+parser.add_argument( '--playback-mode', default='order', choices=( 'order', 'match' ), help='serve recorded exchanges in recorded order, or by matching requests (default: %(default)s)' )
+parser.add_argument( '--playback-latency', default=0.0, type=float, help='replayed fraction of the recorded latency, 1 for the original latency (default: %(default)s)', metavar='FACTOR' )
+parser.add_argument( '--jobs', '-j', default=1, type=int, help='number of test cases to run in parallel (default: %(default)s)', metavar='N' )
 
 parser.add_argument( '--log', action='store_true', help='show log from last execution' )
 parser.add_argument( '--list', '-l', action='store_true', help='list available test cases from test suite' )
 parser.add_argument( '--run', '-r', nargs='?', const=-1, type=int, help='run single test case from test suite', metavar='ID' )
 parser.add_argument( '--runmod', help='run single, parameterless test module', metavar='MODULE' )
+parser.add_argument( '--load', help='call a test module repeatedly to generate load', metavar='MODULE' )
+parser.add_argument( '--capacity', help='find the highest call rate of a test module meeting the --slo', metavar='MODULE' )
+parser.add_argument( '--slo', default='p99<200ms,errors<1%', help='service level objective for --capacity (default: %(default)s)', metavar='SLO' )
+parser.add_argument( '--request', nargs=2, help='use a single OCCI request as load instead of a module', metavar=( 'METHOD', 'PATH' ) )
+parser.add_argument( '--concurrency', type=int, help='number of load workers (default: 1, 16 with --replay, or 64 with --rate)', metavar='C' )
+parser.add_argument( '--rate', type=rateRange, help='start load at a fixed arrival rate per second, or ramp it from R to R2 over the duration; initial rate with --capacity', metavar='R[:R2]' )
+parser.add_argument( '--replay', help='replay a JSON Lines request log against the server', metavar='FILE' )
+parser.add_argument( '--speed', default=1.0, type=float, help='speed-up of the recorded timing with --replay (default: %(default)s)', metavar='F' )
+parser.add_argument( '--max-rate', type=float, help='replay at this many requests per second instead of the recorded timing', metavar='R' )
+parser.add_argument( '--series', default='load-series.csv', help='time series output file with --rate (default: %(default)s)', metavar='FILE' )
+loadLimit = parser.add_mutually_exclusive_group()
+loadLimit.add_argument( '--requests', type=int, help='number of module calls in load mode (default: 100), or of replayed requests', metavar='N' )
+loadLimit.add_argument( '--duration', type=float, help='duration of load mode in seconds (default: 60 with --rate)', metavar='T' )
 parser.add_argument( 'suite', nargs='?', type=suiteOpener, help='test suite file to use' )
 
 def main ():
@@ -28,11 +55,49 @@ def main ():
 	except IOError as e:
 		parser.error( str( e ) )
 	tent = Tent( args.config )
+	if args.timings and tent.client.instrumentation is None:
+		tent.client.instrumentation = Instrumentation()
+	tent.profile = args.profile_mode if args.profile else None
+	if args.trace:
+		tent.tracer = TraceRecorder( args.trace )
+		atexit.register( tent.tracer.close )
+	if args.record or args.playback:
+		tent.cassette = openCassette( args.record or args.playback, 'record' if args.record else args.playback_mode, args.playback_latency )
+		atexit.register( tent.cassette.close )
 	
 	if args.modules:
 		printModuleList( tent )
 		parser.exit()
 	
+	if args.capacity:
+		logFileName = '{}.log'.format( args.suite.name ) if args.suite else 'capacity.log'
+		with open( logFileName, 'a+' ) as logFile:
+			print( '=' * 50 + ' {0} =='.format( datetime.utcnow().isoformat( ' ' ) ), file=logFile )
+			tent.runCapacity( args.capacity, args.slo, startRate=args.rate[0] if args.rate else 10,
+				stepDuration=args.duration or 10, workers=args.concurrency or 64, logFile=logFile )
+			print( file=logFile )
+		parser.exit()
+	
+	if args.replay:
+		print( 'Replaying `{0}`.'.format( args.replay ) )
+		tent.runReplay( args.replay, speed=args.speed, maxRate=args.max_rate, workers=args.concurrency or 16, requests=args.requests )
+		parser.exit()
+	
+	if args.rate:
+		if not args.load and not args.request:
+			parser.error( '--rate requires --load or --request' )
+		print( 'Generating open-loop load with `{0}`.'.format( args.load or ' '.join( args.request ) ) )
+		tent.runRate( args.rate[0], endRate=args.rate[1], duration=args.duration or 60, module=args.load, request=args.request,
+			workers=args.concurrency or 64, seriesFile=args.series )
+		print( 'Time series written to `{0}`.'.format( args.series ) )
+		parser.exit()
+	
+	if args.load:
+		print( 'Generating load with `{0}`.'.format( args.load ) )
+		tent.runLoad( args.load, concurrency=args.concurrency or 1,
+			requests=args.requests if args.requests or args.duration else 100, duration=args.duration )
+		parser.exit()
+	
 	if args.runmod:
 		t = YamlTest( '[module] ' + args.runmod )
 		t.modules.append( { 'module' : args.runmod, 'chain' : None, 'parameters' : {} } )
@@ -43,8 +108,19 @@ def main ():
 	if not args.suite:
 		parser.error( 'no test suite file given' )
 	logFileName = '{}.log'.format( args.suite.name )
+	resultsFileName = '{}.jsonl'.format( args.suite.name )
 	
 	if args.log:
+		try:
+			records = readRun( resultsFileName )
+			header = next( records )
+		except ( IOError, StopIteration ):
+			pass
+		else:
+			print( 'Last execution of `{}`: {}'.format( args.suite.name, header['started'] ) )
+			print( '\n'.join( formatRun( records ) ) )
+			parser.exit()
+		
 		try:
 			f = open( args.suite.name + '.log' )
 		except IOError:
@@ -89,13 +165,14 @@ def main ():
 			parser.error( 'Invalid test case specification.' )
 		
 		print( 'Running single test.' )
+		testCase.depends, testCase.provides = {}, []
 		tent.runTests( ( testCase, ) )
 		parser.exit()
 	
 	with open( logFileName, 'a+' ) as logFile:
 		print( '=' * 50 + ' {0} =='.format( datetime.utcnow().isoformat( ' ' ) ), file=logFile )
 		print( 'Running tests from `{0}`'.format( args.suite.name ) )
-		tent.runSuite( args.suite, logFile )
+		tent.runSuite( args.suite, logFile, jobs=args.jobs, sink=JSONLinesSink( resultsFileName, suite=args.suite.name ) )
 		print( file=logFile )
 
 def printTestCases ( suiteName, testCases ):
@@ -8,9 +8,9 @@ from inc.client import OCCIError
 modules = {}
 __all__ = []
 
-def _importModules ( locals, globals ):
+def _importModules ():
 	'''Import submodules from the current package and expose them through the module.'''
-	import os
+	import importlib, os
 
 	for file in os.listdir( os.path.dirname( __file__ ) ):
 		if not file.endswith( '.py' ) or file.startswith( '__init__.' ):
@@ -18,7 +18,7 @@ def _importModules ( locals, globals ):
 		
 		moduleName = file[:-3]
 		if moduleName not in __all__:
-			modules[moduleName] = __import__( moduleName, locals, globals )
+			modules[moduleName] = importlib.import_module( '.' + moduleName, __name__ )
 			__all__.append( moduleName )
 
 			for obj in modules[moduleName].__all__:
@@ -33,4 +33,4 @@ def testModule ( function ):
 	return function
 
 # initialize module
-_importModules( locals(), globals() )
\ No newline at end of file
+_importModules()
\ No newline at end of file
@@ -55,13 +55,14 @@ def builtinStructures ( t, testInfrastructureTypes : 'Test for infrastructure ty
 	rsp = t.request( 'GET', '/-/' )
 	t.log( len( rsp.structures ), 'structures found.' )
 	t.assertTrue( len( rsp.structures ) > 0 )
+	index = CategoryIndex.fromResponse( rsp )
 	
 	for structure in coreStructures:
-		t.assertIn( structure, rsp.structures, '{0.term} not defined'.format( structure ) )
+		t.assertIn( structure, index, '{0.term} not defined'.format( structure ) )
 	
 	if testInfrastructureTypes:
 		for structure in infrastructureStructures:
-			t.assertIn( structure, rsp.structures, '{0.term} not defined'.format( structure ) )
+			t.assertIn( structure, index, '{0.term} not defined'.format( structure ) )
 
 @testModule
 def fixedFilter ( t ):
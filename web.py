@@ -8,11 +8,13 @@ import argparse, glob, os, shutil
 import threading, sys
 import webbrowser
 
+from inc.results import JSONLinesSink, formatRun, readRun
 from inc.tent import Tent
 
 class TentRequestHandler ( BaseHTTPRequestHandler ):
 	server_version = 'TentWeb/1.0'
 	tent = None
+	jobs = 1
 	homelink = '<a id="homelink" href="/">Home</a>'
 	
 	def GET_main ( self, *path ):
@@ -68,7 +70,8 @@ class TentRequestHandler ( BaseHTTPRequestHandler ):
 				from datetime import datetime
 				with open( logFileName, 'a+' ) as logFile:
 					print( '=' * 50 + ' {0} =='.format( datetime.utcnow().isoformat( ' ' ) ), file=logFile )
-					tent.runSuite( suiteFile, logFile, suppressPrint=True )
+					tent.runSuite( suiteFile, logFile, suppressPrint=True, jobs=self.jobs,
+						sink=JSONLinesSink( '{}.jsonl'.format( suiteFile.name ), suite=suiteFile.name ) )
 					print( file=logFile )
 			
 			threading.Thread( name='SuiteRunner', target=run, args=( self.tent, ) ).start()
@@ -81,6 +84,17 @@ class TentRequestHandler ( BaseHTTPRequestHandler ):
 	def GET_log ( self, suite, *path ):
 		body = [ self.homelink, '<h1>Log of suite: ' + suite + '</h1>' ]
 		
+		try:
+			records = readRun( 'suites/' + suite + '.yaml.jsonl' )
+			header = next( records )
+		except ( IOError, StopIteration ):
+			pass
+		else:
+			body.append( '<p>Last execution of suite <strong>{}</strong>: {}'.format( suite, header['started'] ) + '</p>' )
+			body.append( '<pre>\n' + '\n'.join( formatRun( records ) ) + '</pre>' )
+			self.sendHtmlResponse( body )
+			return
+		
 		try:
 			f = open( 'suites/' + suite + '.yaml.log' )
 		except IOError:
@@ -185,6 +199,7 @@ if __name__ == '__main__':
 	parser = argparse.ArgumentParser( description='OCCI tent web interface', epilog=None )
 	parser.add_argument( '--config', '-c', default='config.yaml', type=open, help='configuration file (default: %(default)s)', metavar='FILE' )
 	parser.add_argument( '--port', '-p', default=8080, type=int, help='port on which the webserver should listen (default: %(default)s)' )
+	parser.add_argument( '--jobs', '-j', default=1, type=int, help='number of test cases to run in parallel (default: %(default)s)', metavar='N' )
 	
 	try:
 		args = parser.parse_args()
@@ -192,6 +207,7 @@ if __name__ == '__main__':
 		parser.error( str( e ) )
 	
 	TentRequestHandler.tent = Tent( args.config )
+	TentRequestHandler.jobs = args.jobs
 	httpd = HTTPServer( ( '', args.port ), TentRequestHandler )
 	try:
 		print( 'Serving on {0}:{1}...'.format( *httpd.socket.getsockname() ) )